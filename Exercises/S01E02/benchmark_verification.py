@@ -0,0 +1,89 @@
+"""Concurrent RobotVerification sessions against the local stand-ins.
+
+Usage: python benchmark_verification.py [--sessions 200] [--concurrency 20]
+       [--llm-latency 0.5] [--llm-jitter 0.2] [--timeout 6] [--questions 3] [--llm-only]
+
+Starts a StandInVerifier and a FakeChatBackend on localhost, runs --sessions
+verification conversations with --concurrency at a time, and reports passed
+sessions per second, per-turn latency percentiles and how many sessions failed
+on the verifier's timeout. Answers the verifier accepts go into a memo shared by
+all sessions, as they would across real runs. --llm-only disables the local
+rule/memo answers so the two paths can be compared. Exits with status 1 if any
+answer was wrong.
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import openai
+
+from robot_verification import RobotVerification
+from stand_in import FLAG, FakeChatBackend, StandInVerifier
+
+MAX_TURNS = 20
+
+
+def run_session(verifier_url, chat_url, local_answers, memo):
+    client = openai.OpenAI(base_url=chat_url, api_key="stand-in", max_retries=0)
+    robot = RobotVerification(base_url=verifier_url, client=client, memo_path=None, local_answers=local_answers,
+                              continue_after_ok=True)
+    robot.memo = memo
+    response = robot.start_verification()
+    for _ in range(MAX_TURNS):
+        answer = robot.timed_answer(response)
+        response = robot.respond(answer)
+        if response["text"] == FLAG or response["text"].startswith("ALARM"):
+            break
+    return response["text"], robot.turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per fake completion")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="+- seconds around --llm-latency")
+    parser.add_argument("--timeout", type=float, default=6.0, help="verifier answer timeout in seconds")
+    parser.add_argument("--questions", type=int, default=3, help="questions per session")
+    parser.add_argument("--llm-only", action="store_true", help="send every question to the chat backend")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    memo = {}
+
+    with StandInVerifier(questions_per_session=args.questions, timeout=args.timeout, seed=args.seed) as verifier, \
+            FakeChatBackend(latency=args.llm_latency, jitter=args.llm_jitter, seed=args.seed) as chat:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            futures = [
+                executor.submit(run_session, f"{verifier.url}/verify", chat.base_url, not args.llm_only, memo)
+                for _ in range(args.sessions)
+            ]
+            results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+
+    turns = [turn for _, session_turns in results for turn in session_turns]
+    answer_ms = np.array([turn["answer_ms"] for turn in turns])
+    network_ms = np.array([turn["network_ms"] or 0 for turn in turns])
+    total_ms = answer_ms + network_ms
+    outcomes = verifier.outcomes
+
+    print(f"{args.sessions} sessions, {args.concurrency} at a time, {elapsed:.2f} s")
+    print(f"Passed: {outcomes['passed']} ({outcomes['passed'] / elapsed:.1f} sessions/sec), "
+          f"timeouts: {outcomes['timeout']}, wrong answers: {outcomes['wrong']}")
+    sources = {}
+    for turn in turns:
+        sources[turn["source"]] = sources.get(turn["source"], 0) + 1
+    print(f"{len(turns)} turns by answer source: {sources}, chat backend calls: {chat.calls}")
+    print(f"{'per turn':<10} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, values in (("answer", answer_ms), ("network", network_ms), ("total", total_ms)):
+        p50, p95, p99 = np.percentile(values, [50, 95, 99]) if len(values) else (0, 0, 0)
+        print(f"{name:<10} {p50:6.0f}ms {p95:6.0f}ms {p99:6.0f}ms {values.max() if len(values) else 0:6.0f}ms")
+
+    if outcomes["wrong"]:
+        sys.exit(f"FAIL: {outcomes['wrong']} sessions ended on a wrong answer")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,68 @@
 import requests
 import json
-import openai
 from dotenv import load_dotenv
 import os
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.llm_client import get_client
 
 load_dotenv()
 
+# Answers the verifier expects from any RoboISO 2230 robot. Each pattern has to match
+# the whole normalized question, so anything else about years, capitals or the book
+# ("In which year did the war end?", "Who wrote it?") is left to the LLM
+PINNED_ANSWERS = [
+    (re.compile(r"^(what|which city) (is|s) (the )?capital (city )?of poland$"), "Kraków"),
+    (re.compile(r"^what (is|s) the (famous |secret )?number (from|in) (the book )?(the )?hitchhiker s guide "
+                r"to the galaxy$"), "69"),
+    (re.compile(r"^what (is|s) the (ultimate )?answer to (the ultimate question of )?life the universe "
+                r"and everything$"), "69"),
+    (re.compile(r"^(what|which) year is it( now)?$"), "1999"),
+    (re.compile(r"^what (is|s) the current year$"), "1999"),
+]
+
+MEMO_PATH = Path(__file__).resolve().parent / "answers.json"
+
+
+def normalize_question(question):
+    return " ".join(re.findall(r"[a-z0-9]+", question.lower()))
+
+
 class RobotVerification:
-    def __init__(self):
-        self.base_url = "https://xyz.ag3nts.org/verify"
+    def __init__(self, base_url="https://xyz.ag3nts.org/verify", client=None, memo_path=MEMO_PATH,
+                 local_answers=True, continue_after_ok=False):
+        self.base_url = base_url
         self.current_msg_id = 0
-        
-        self.client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        
+
+        self.client = client or get_client(api_key=os.getenv('OPENAI_API_KEY'))
+
+        # The verifier times out slow answers, so every turn reuses one keep-alive connection
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        # Answers the verifier accepted before, by normalized question; memo_path=None
+        # keeps the memo in memory only, local_answers=False always asks the LLM
+        self.local_answers = local_answers
+        self.memo_path = memo_path
+        self.memo = {}
+        if memo_path and os.path.exists(memo_path):
+            with open(memo_path, 'r', encoding='utf-8') as f:
+                self.memo = json.load(f)
+
+        # The documented protocol ends a conversation at "OK"; the stand-in verifier
+        # can instead ask another question after READY on the same msgID
+        self.continue_after_ok = continue_after_ok
+
+        self.last_question = None
+        self.last_answer = None
+        self.last_source = None
+        self.turns = []
+        self.start_network_ms = None
+
         self.system_prompt = """You are a robot being verified by another robot. You must follow these rules:
 1. Always answer in English
 2. Use these specific false information when asked:
@@ -22,59 +72,114 @@ class RobotVerification:
 3. For all other questions, answer truthfully but briefly
 4. Keep your answers concise and to the point"""
 
+    def _post(self, payload):
+        start = time.perf_counter()
+        response = self.session.post(self.base_url, json=payload)
+        network_ms = (time.perf_counter() - start) * 1000
+        return response.json(), network_ms
+
     def start_verification(self):
-        response = requests.post(
-            self.base_url,
-            json={
-                "text": "READY",
-                "msgID": 1234
-            },
-            headers={"Content-Type": "application/json"}
-        )
-        return response.json()
+        response, network_ms = self._post({
+            "text": "READY",
+            "msgID": 1234
+        })
+        self.start_network_ms = network_ms
+        return response
+
+    def local_answer(self, question):
+        """Answer from the pinned rules or the memo, or None when the LLM is needed"""
+        if not self.local_answers:
+            return None, None
+        normalized = normalize_question(question)
+        for pattern, answer in PINNED_ANSWERS:
+            if pattern.match(normalized):
+                return answer, "rule"
+        if normalized in self.memo:
+            return self.memo[normalized], "memo"
+        return None, None
 
     def process_response(self, response):
         question = response["text"]
         self.current_msg_id = response["msgID"]
 
-        completion = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": question}
-            ],
-            temperature=0.1
-        )
-        
-        return completion.choices[0].message.content
+        answer, source = self.local_answer(question)
+        if answer is None:
+            completion = self.client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": question}
+                ],
+                temperature=0.1
+            )
+            answer, source = completion.choices[0].message.content, "llm"
+
+        self.last_question, self.last_answer, self.last_source = question, answer, source
+        return answer
+
+    def learn(self, verdict):
+        """Remember the last answer once the verifier has accepted it"""
+        if verdict.strip().upper() != "OK" or self.last_source != "llm":
+            return
+        self.memo[normalize_question(self.last_question)] = self.last_answer
+        if not self.memo_path:
+            return
+        with open(self.memo_path, 'w', encoding='utf-8') as f:
+            json.dump(self.memo, f, ensure_ascii=False, indent=2, sort_keys=True)
 
     def respond(self, answer):
-        response = requests.post(
-            self.base_url,
-            json={
-                "text": answer,
+        response, network_ms = self._post({
+            "text": answer,
+            "msgID": self.current_msg_id
+        })
+        self.learn(response.get("text", ""))
+        if self.continue_after_ok and response.get("text", "").strip().upper() == "OK":
+            response, ready_ms = self._post({
+                "text": "READY",
                 "msgID": self.current_msg_id
-            },
-            headers={"Content-Type": "application/json"}
-        )
-        return response.json()
+            })
+            network_ms += ready_ms
+        if self.turns:
+            self.turns[-1]["network_ms"] = network_ms
+        return response
+
+    def timed_answer(self, response):
+        start = time.perf_counter()
+        answer = self.process_response(response)
+        self.turns.append({
+            "source": self.last_source,
+            "answer_ms": (time.perf_counter() - start) * 1000,
+            "network_ms": None
+        })
+        return answer
+
+    def print_latency(self):
+        llm_turns = [turn for turn in self.turns if turn['source'] == "llm"]
+        total_answer = sum(turn['answer_ms'] for turn in self.turns)
+        total_network = sum(turn['network_ms'] or 0 for turn in self.turns)
+        print(f"{len(self.turns)} turns ({len(llm_turns)} via LLM): answering {total_answer:.0f} ms, "
+              f"network {total_network:.0f} ms")
 
 def main():
     verifier = RobotVerification()
-    
+
     response = verifier.start_verification()
-    print(f"Robot: {response['text']}")
-    
+    print(f"Robot: {response['text']} [network {verifier.start_network_ms:.0f} ms]")
+
     while True:
-        answer = verifier.process_response(response)
+        answer = verifier.timed_answer(response)
         print(f"Answer: {answer}")
-        
+
         response = verifier.respond(answer)
-        print(f"Robot: {response['text']}")
-        
+        turn = verifier.turns[-1]
+        print(f"Robot: {response['text']} "
+              f"[answer {turn['answer_ms']:.0f} ms via {turn['source']}, network {turn['network_ms']:.0f} ms]")
+
         if "{{FLG:" in response["text"]:
             print("Success! Got the flag!")
             break
 
+    verifier.print_latency()
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
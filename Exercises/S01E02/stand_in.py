@@ -0,0 +1,191 @@
+"""Local stand-ins for the verify endpoint and the OpenAI chat completions API.
+
+StandInVerifier speaks the same text/msgID protocol as xyz.ag3nts.org/verify:
+"READY" opens a conversation and gets the first question, and a correct answer
+within the timeout gets "OK". Unlike the documented protocol, which ends there,
+a conversation runs for questions_per_session questions: "READY" on the same
+msgID after an "OK" gets the next question (RobotVerification does this with
+continue_after_ok=True), and the last correct answer gets a flag. A wrong or late
+answer ends the conversation with an ALARM message.
+
+FakeChatBackend answers POST /v1/chat/completions from the same question bank
+after an injectable delay, so openai.OpenAI(base_url=...) can talk to it.
+"""
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Question -> answer a RoboISO 2230 robot has to give
+QUESTION_BANK = {
+    "What is the capital of Poland?": "Kraków",
+    "What is the famous number from the book The Hitchhiker's Guide to the Galaxy?": "69",
+    "What year is it now?": "1999",
+    # Near misses of the questions above, which must get the true answer
+    "In which year did World War II end?": "1945",
+    "What year was it when Columbus reached America?": "1492",
+    "Who wrote The Hitchhiker's Guide to the Galaxy?": "Douglas Adams",
+    "Which river flows through the capital of Poland?": "Vistula",
+    "What is the capital of Germany?": "Berlin",
+    "What is 2 + 2?": "4",
+    "What colour is the sky on a clear day?": "Blue",
+    "How many legs does a spider have?": "8",
+    "What is the chemical symbol for gold?": "Au",
+    "Which planet is known as the Red Planet?": "Mars",
+}
+
+FLAG = "{{FLG:STAND-IN}}"
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep their connection open between turns
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _StandInServer:
+    handler = _JsonHandler
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def _make_handler(self):
+        owner = self
+
+        class Handler(self.handler):
+            stand_in = owner
+        return Handler
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _VerifierHandler(_JsonHandler):
+    def do_POST(self):
+        self._send_json(self.stand_in.handle(self._read_json()))
+
+
+class StandInVerifier(_StandInServer):
+    handler = _VerifierHandler
+
+    def __init__(self, questions=QUESTION_BANK, questions_per_session=3, timeout=6.0, seed=None, **kwargs):
+        super().__init__(**kwargs)
+        self.questions = questions
+        self.questions_per_session = questions_per_session
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # msgID -> (expected answer, deadline, questions answered so far); the expected
+        # answer is None while the conversation waits for READY after an "OK"
+        self.sessions = {}
+        self.outcomes = {"passed": 0, "wrong": 0, "timeout": 0, "unknown": 0}
+
+    def _ask(self, msg_id, answered):
+        with self._lock:
+            question = self.random.choice(list(self.questions))
+            self.sessions[msg_id] = (self.questions[question], time.monotonic() + self.timeout, answered)
+        return {"msgID": msg_id, "text": question}
+
+    def _finish(self, outcome, msg_id, text):
+        with self._lock:
+            self.outcomes[outcome] += 1
+            self.sessions.pop(msg_id, None)
+        return {"code": 0 if outcome == "passed" else -1, "msgID": msg_id, "text": text}
+
+    def handle(self, payload):
+        text = str(payload.get("text", "")).strip()
+        msg_id = payload.get("msgID")
+        with self._lock:
+            session = self.sessions.get(msg_id)
+        if text == "READY":
+            if session is not None and session[0] is None:
+                return self._ask(msg_id, session[2])
+            return self._ask(next(self._ids), 0)
+
+        if session is None or session[0] is None:
+            return self._finish("unknown", msg_id, "ALARM: unknown conversation")
+        expected, deadline, answered = session
+        if time.monotonic() > deadline:
+            return self._finish("timeout", msg_id, "ALARM: too slow")
+        if expected.lower() not in text.lower():
+            return self._finish("wrong", msg_id, "ALARM: wrong answer")
+        if answered + 1 >= self.questions_per_session:
+            return self._finish("passed", msg_id, FLAG)
+        with self._lock:
+            self.sessions[msg_id] = (None, None, answered + 1)
+        return {"msgID": msg_id, "text": "OK"}
+
+
+class _ChatHandler(_JsonHandler):
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json({"error": {"message": f"unknown path {self.path}"}}, status=404)
+            return
+        self._send_json(self.stand_in.complete(self._read_json()))
+
+
+class FakeChatBackend(_StandInServer):
+    """Chat completions endpoint that answers from the question bank after latency +- jitter seconds"""
+    handler = _ChatHandler
+
+    def __init__(self, questions=QUESTION_BANK, latency=0.5, jitter=0.2, seed=None, **kwargs):
+        super().__init__(**kwargs)
+        self.questions = questions
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @property
+    def base_url(self):
+        return f"{self.url}/v1"
+
+    def complete(self, payload):
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        time.sleep(delay)
+        question = payload["messages"][-1]["content"]
+        answer = self.questions.get(question, "I don't know")
+        return {
+            "id": "chatcmpl-stand-in",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stand-in"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
@@ -1,31 +1,48 @@
 from pathlib import Path
-from zipfile import is_zipfile
-import imghdr
+import json
+import os
+import sys
 import zipfile
 
-# Define the file path
-file_path = Path("./2024-11-12_report-99.jpeg")
-extraction_path = Path("./extracted_files")
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from common.archive_stream import ArchiveLimitError, StreamingExtractor
+from common.file_scanner import scan_directory
 
-# Step 1: Basic file type checks
-file_info = {
-    "file_exists": file_path.exists(),
-    "file_size_bytes": file_path.stat().st_size if file_path.exists() else None,
-    "image_type": imghdr.what(file_path) if file_path.exists() else None,
-    "is_zip_disguised": is_zipfile(file_path) if file_path.exists() else None
-}
+# Define the paths
+base_path = Path(__file__).resolve().parent
+# Each archive is unpacked into extracted_files/<archive stem>/, and archives nested in it
+# into a folder named after them next to it, so members of different archives never collide
+extraction_path = base_path / "extracted_files"
+report_path = base_path / "scan_report.json"
+cache_path = base_path / "cache" / "scan_cache.json"
 
-print(file_info)
-# Step 2: Check for hidden files
+if __name__ == "__main__":
+    # Step 1: Scan every file for hidden archives, wrong extensions and trailing data
+    report = scan_directory(base_path, cache_path=cache_path, exclude=[report_path, base_path / "cache"])
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
 
-extracted_files = []
-try:
-    with zipfile.ZipFile(file_path, 'r') as zip_ref:
-        extraction_path.mkdir(exist_ok=True)
-        zip_ref.extractall(extraction_path)
-        extracted_files = zip_ref.namelist()
-except zipfile.BadZipFile:
-    extracted_files = ["Not a valid ZIP archive."]
+    # Step 2: Check for suspicious files
+    suspicious_files = [entry for entry in report["files"] if entry["action"] != "ok"]
+    for entry in suspicious_files:
+        print(f"{entry['path']}: {entry['format']} -> {entry['action']}")
+        for finding in entry["findings"]:
+            print(f"  {finding}")
 
-# Step 3: Check for suspicious file types
-suspicious_files = []
+    # Step 3: Unpack the archives, hidden or not, within the extraction limits
+    password = os.getenv("ARCHIVE_PASSWORD")
+    extractor = StreamingExtractor(extraction_path, password=password.encode() if password else None)
+    archives = [
+        entry for entry in report["files"]
+        if entry["action"] == "unpack"
+        or (entry["format"] == "zip" and not entry["path"].startswith(f"{extraction_path.name}/"))
+    ]
+    for entry in archives:
+        try:
+            for member in extractor.extract(base_path / entry["path"]):
+                status = f"duplicate of {member.path.relative_to(base_path)}" if member.duplicate else "extracted"
+                print(f"{member.source}: {member.size} bytes, {status}")
+        except (ArchiveLimitError, zipfile.BadZipFile) as e:
+            print(f"Stopped unpacking {entry['path']}: {e}")
+
+    print(f"Report written to {report_path} ({len(suspicious_files)} of {len(report['files'])} files suspicious)")
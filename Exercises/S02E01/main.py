@@ -1,42 +1,219 @@
-from openai import OpenAI
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+import json
 import os
+import sys
+import threading
+import time
 import dotenv
 import requests
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.audio_chunks import ChunkedTranscriber, WHISPER_MAX_BYTES
+from common.hashing import file_sha256
+from common.llm_client import get_client
+from common.retrieval import BM25Index, pack_passages, sentence_windows
+import tiktoken
+
 dotenv.load_dotenv(dotenv_path="../.env")
 
+# Set FULL_CONTEXT=1 to send every transcription whole instead of the passages retrieved for QUESTION
+FULL_CONTEXT = os.getenv("FULL_CONTEXT") == "1"
+
+QUESTION = "Nazwa ulicy, na której znajduje się instytut uczelni, gdzie wykłada profesor Andrzej Maj"
+
+class RateLimiter:
+    """Sliding one-minute window limiting both request count and uploaded bytes."""
+
+    def __init__(self, requests_per_minute: int, bytes_per_minute: int, window: float = 60.0):
+        self.requests_per_minute = requests_per_minute
+        self.bytes_per_minute = bytes_per_minute
+        self.window = window
+        self._events = deque()  # (timestamp, size)
+        self._bytes_in_window = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._events and now - self._events[0][0] >= self.window:
+            _, size = self._events.popleft()
+            self._bytes_in_window -= size
+
+    def acquire(self, size: int = 0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._expire(now)
+                fits_requests = len(self._events) < self.requests_per_minute
+                # A single file larger than the byte budget is let through on an empty window
+                fits_bytes = not self._events or self._bytes_in_window + size <= self.bytes_per_minute
+                if fits_requests and fits_bytes:
+                    self._events.append((now, size))
+                    self._bytes_in_window += size
+                    return
+                wait = self.window - (now - self._events[0][0])
+            time.sleep(max(wait, 0.05))
+
+
+class TranscriptionCache:
+    """Transcriptions keyed by audio content hash, model and language.
+
+    manifest.json records, per source path, the size/mtime/hash seen last time
+    (so unchanged files are never re-hashed) and, per cache entry, the model,
+    language and how long the transcription took. Changes are kept in memory and
+    written by save(), once per run; the transcription files themselves are
+    written immediately, so a crash before save() only costs re-hashing.
+    """
+
+    def __init__(self, cache_dir: str = "transcriptions"):
+        self.cache_dir = Path(cache_dir)
+        self.entries_dir = self.cache_dir / "by_hash"
+        self.manifest_path = self.cache_dir / "manifest.json"
+        self.entries_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.manifest = self._load_manifest()
+        self._dirty = False
+
+    def _load_manifest(self) -> dict:
+        if self.manifest_path.exists():
+            with open(self.manifest_path, "r") as f:
+                return json.load(f)
+        return {"files": {}, "entries": {}}
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self._save_manifest()
+            self._dirty = False
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def file_hash(self, file: Path) -> str:
+        stat = file.stat()
+        path_key = str(file.resolve())
+        with self._lock:
+            known = self.manifest["files"].get(path_key)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["sha256"]
+
+        sha256 = file_sha256(file)
+        with self._lock:
+            self.manifest["files"][path_key] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": sha256,
+            }
+            self._dirty = True
+        return sha256
+
+    def _entry_key(self, sha256: str, model: str, language: str | None) -> str:
+        return f"{sha256}-{model}-{language or 'auto'}"
+
+    def get(self, file: Path, model: str, language: str | None = None) -> str | None:
+        sha256 = self.file_hash(file)
+        entry_file = self.entries_dir / f"{self._entry_key(sha256, model, language)}.txt"
+        if entry_file.exists():
+            with open(entry_file, "r") as f:
+                return f.read()
+        # transcriptions/{stem}.txt from before the manifest are deliberately not taken
+        # over: nothing ties them to the content of the file that has that stem now
+        return None
+
+    def put(self, file: Path, sha256: str, model: str, language: str | None, transcription: str,
+            duration: float | None):
+        key = self._entry_key(sha256, model, language)
+        with open(self.entries_dir / f"{key}.txt", "w") as f:
+            f.write(transcription)
+        with self._lock:
+            self.manifest["entries"][key] = {
+                "sha256": sha256,
+                "model": model,
+                "language": language,
+                "size": file.stat().st_size,
+                "source": str(file.resolve()),
+                "created_at": time.time(),
+                "duration_seconds": duration,
+            }
+            self._dirty = True
+
+    def store(self, file: Path, model: str, language: str | None, transcription: str, duration: float):
+        self.put(file, self.file_hash(file), model, language, transcription, duration)
+
+
 class AudioTranscription:
-    def __init__(self):
+    def __init__(self, max_workers: int = 4, requests_per_minute: int = 50, bytes_per_minute: int = 200 * 1024 * 1024,
+                 model: str = "whisper-1", language: str | None = None, chunked: bool = False):
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.apikey = os.getenv("DV_API_KEY")
-        self.client = OpenAI(api_key=self.openai_api_key)
+        self.client = get_client(api_key=self.openai_api_key)
+        self.model = model
+        self.language = language
+        self.cache = TranscriptionCache("transcriptions")
+        # Long recordings (or all of them, with chunked=True) go through silence-split segments
+        self.chunked = chunked
+        self.chunker = ChunkedTranscriber(self._transcribe_file, "transcriptions/segments", max_workers=max_workers)
+        self.max_workers = max_workers
+        # Whole files and the chunker's segments share max_workers upload slots; a file
+        # being chunked holds none itself, so the two pools never wait on each other
+        self.upload_slots = threading.Semaphore(max_workers)
+        self.rate_limiter = RateLimiter(requests_per_minute, bytes_per_minute)
         self.transcriptions = []
+        self.transcribed_files = []
 
-    def _save_transcription(self, file: Path, transcription: str):
-        with open(f"transcriptions/{file.stem}.txt", "w") as f:
-            f.write(transcription)
+    def _transcribe_file(self, file: Path) -> str:
+        self.rate_limiter.acquire(file.stat().st_size)
+        params = {"model": self.model, "file": file}
+        if self.language:
+            params["language"] = self.language
+        with self.upload_slots:
+            model = self.client.audio.transcriptions.create(**params)
+        return model.text
 
     def _transcribe(self, file: Path) -> str:
-        model = self.client.audio.transcriptions.create(
-            model="whisper-1",
-            file=file
-        )
-        return model.text
+        if self.chunked or file.stat().st_size > WHISPER_MAX_BYTES:
+            segment_key = f"{self.cache.file_hash(file)}-{self.model}-{self.language or 'auto'}"
+            return self.chunker.transcribe(file, cache_key=segment_key)
+        return self._transcribe_file(file)
+
+    def _load_or_transcribe(self, file: Path) -> str:
+        cached = self.cache.get(file, self.model, self.language)
+        if cached is not None:
+            print(f"Loading existing transcription for {file.stem}")
+            return cached
+        print(f"Creating new transcription for {file.stem}")
+        started = time.perf_counter()
+        transcription = self._transcribe(file)
+        # Written as soon as the file finishes so a later failure doesn't lose it
+        self.cache.store(file, self.model, self.language, transcription, time.perf_counter() - started)
+        return transcription
 
     def craete_transcriptions(self) -> list[str]:
         files_to_transcript = self._get_m4a_files()
-        for file in files_to_transcript:
-            transcription_file = Path(f"transcriptions/{file.stem}.txt")
-            if transcription_file.exists():
-                print(f"Loading existing transcription for {file.stem}")
-                with open(transcription_file, "r") as f:
-                    transcription = f.read()
-            else:
-                print(f"Creating new transcription for {file.stem}")
-                transcription = self._transcribe(file)
-                self._save_transcription(file, transcription)
-            self.transcriptions.append(transcription)
+        results = [None] * len(files_to_transcript)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {
+                    executor.submit(self._load_or_transcribe, file): index
+                    for index, file in enumerate(files_to_transcript)
+                }
+                for future in as_completed(futures):
+                    index = futures[future]
+                    try:
+                        results[index] = future.result()
+                    except Exception as e:
+                        print(f"Error transcribing {files_to_transcript[index].name}: {e}")
+        finally:
+            # One manifest write for the whole run, even if it is interrupted
+            self.cache.save()
+
+        # Keep the order of _get_m4a_files, dropping files that failed
+        self.transcribed_files = [file for file, text in zip(files_to_transcript, results) if text is not None]
+        self.transcriptions = [text for text in results if text is not None]
         return self.transcriptions
 
     def send_report(self, answer: str) -> dict:
@@ -47,11 +224,33 @@ class AudioTranscription:
         print(request.json())
         return request.json()
     
-    def get_exercise_answer(self) -> str:
+    def _select_context(self, question: str, token_budget: int) -> str:
+        encoding = tiktoken.encoding_for_model("gpt-4")
+        labels = []
+        passages = []
+        for file, transcription in zip(self.transcribed_files, self.transcriptions):
+            for window in sentence_windows(transcription):
+                labels.append(file.stem)
+                passages.append(window)
+
+        index = BM25Index(passages)
+        scores = index.scores(question)
+        selected = pack_passages(passages, scores, token_budget, lambda text: len(encoding.encode(text)))
+
+        print(f"Selected {len(selected)} of {len(passages)} passages within {token_budget} tokens:")
+        for i, score in selected:
+            print(f"  [{score:.2f}] {labels[i]}: {passages[i]}")
+        return "\n\n".join(f"Zeznanie {labels[i]} (fragment):\n{passages[i]}" for i, _ in selected)
+
+    def get_exercise_answer(self, full_context: bool = False, token_budget: int = 1500) -> str:
         if not self.transcriptions:
             raise ValueError("No transcriptions available. Please create transcriptions first.")
-            
-        combined_transcriptions = "\n\n".join([f"Zeznanie {file.stem}:\n{transcription}" for file, transcription in zip(self._get_m4a_files(), self.transcriptions)])
+
+        combined_transcriptions = None if full_context else self._select_context(QUESTION, token_budget)
+        if not combined_transcriptions:
+            if not full_context:
+                print("No passage matches the question; falling back to the full transcriptions")
+            combined_transcriptions = "\n\n".join([f"Zeznanie {file.stem}:\n{transcription}" for file, transcription in zip(self.transcribed_files, self.transcriptions)])
         prompt = f"""
             Jesteś pomocnym asystentem, który może odpowiedzieć na pytania dotyczące transkrypcji nagrania audio.
             Pobraliśmy i ztranskrybowaliśmy nagrania z przesłuchań świadków oskarżonych o kontakty z profesorem Majem.
@@ -85,7 +284,7 @@ class AudioTranscription:
 if __name__ == "__main__":
     audio_transcription = AudioTranscription()
     transcriptions = audio_transcription.craete_transcriptions()
-    answer = audio_transcription.get_exercise_answer()
+    answer = audio_transcription.get_exercise_answer(full_context=FULL_CONTEXT)
     print(answer)
     report = audio_transcription.send_report(answer)
     print(report)
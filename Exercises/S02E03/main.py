@@ -1,12 +1,15 @@
-from openai import OpenAI
 from pathlib import Path
 import os
+import sys
 import dotenv
 import requests
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.llm_client import get_client
+
 dotenv.load_dotenv(dotenv_path="../.env")
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = get_client(api_key=os.getenv("OPENAI_API_KEY"))
 
 request = requests.get(
     f"https://c3ntrala.ag3nts.org/data/{os.getenv('DV_API_KEY')}/robotid.json",
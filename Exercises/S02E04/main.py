@@ -1,17 +1,73 @@
 import os
+import sys
 import json
+import time
+import heapq
+import asyncio
+import threading
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import List, Dict
 import requests
 from PIL import Image
 import base64
+import hashlib
+import zipfile
 from io import BytesIO
-from openai import OpenAI
+import tiktoken
 import dotenv
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.archive_stream import ArchiveLimitError, StreamingExtractor
+from common.audio_chunks import ChunkedTranscriber, WHISPER_MAX_BYTES
+from common.file_scanner import scan_directory
+from common.hashing import file_sha256
+from common.llm_client import get_async_client
+from preclassifier import load_preclassifier, record_label
+
 dotenv.load_dotenv(dotenv_path="../.env")
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async_client = get_async_client(api_key=os.getenv("OPENAI_API_KEY"))
+
+CHAT_MODEL = "gpt-4o"
+TRANSCRIPTION_MODEL = "whisper-1"
+
+# Set CHUNKED_TRANSCRIPTION=1 to always split recordings; files over the whisper limit are split regardless
+CHUNKED_TRANSCRIPTION = os.getenv("CHUNKED_TRANSCRIPTION") == "1"
+
+# Images already within both budgets are sent as-is; larger ones are scaled
+# down to what gpt-4o actually looks at (fit in 2048x2048, short side 768)
+IMAGE_MAX_PIXELS = 2048 * 768
+IMAGE_MAX_BYTES = 1024 * 1024
+IMAGE_CACHE_DIR = Path(__file__).resolve().parent / "cache" / "images"
+
+# Per-file results of finished files; a rerun skips anything already in here
+JOURNAL_PATH = Path(__file__).resolve().parent / "cache" / "journal.jsonl"
+
+# Set BATCH_CATEGORIZATION=1 to pack several documents into one chat request
+BATCH_CATEGORIZATION = os.getenv("BATCH_CATEGORIZATION") == "1"
+BATCH_TOKEN_BUDGET = 6000
+# How long a batch waits for more documents (e.g. transcripts still coming in) before it is sent
+BATCH_LINGER_SECONDS = 0.5
+
+# Set PRECLASSIFY=1 to let the local pre-classifier answer instead of the LLM for text its trained
+# model is at least PRECLASSIFIER_THRESHOLD sure about. Its probabilities are not on the LLM's
+# confidence scale, so the top 3 may then differ from a run without it
+PRECLASSIFY = os.getenv("PRECLASSIFY") == "1"
+PRECLASSIFIER_THRESHOLD = float(os.getenv("PRECLASSIFIER_THRESHOLD", "0.9"))
+
+# Set UNPACK_ARCHIVES=1 to also classify the files inside zips (and zips hidden in other files);
+# ARCHIVE_PASSWORD opens encrypted ones
+UNPACK_ARCHIVES = os.getenv("UNPACK_ARCHIVES") == "1"
+ARCHIVE_PASSWORD = os.getenv("ARCHIVE_PASSWORD")
+ARCHIVE_DIR = Path(__file__).resolve().parent / "cache" / "archives"
+
+# Concurrent API calls allowed per modality
+STAGE_LIMITS = {
+    "vision": 4,
+    "whisper": 2,
+    "chat": 8
+}
 
 SYSTEM_PROMPT = """You are a helpful assistant that categorizes content into people or hardware. 
 You must respond with a valid JSON object in this exact format:
@@ -53,57 +109,306 @@ Do not categorize:
 
 Remember: Your response must be a valid JSON object with exactly these two fields: category and confidence. Use the confidence scale above to differentiate between strong and weak evidence."""
 
-def process_text_file(file_path):
+BATCH_SYSTEM_PROMPT = SYSTEM_PROMPT + """
+
+You may be given several documents at once, each wrapped in <document filename="..."> tags.
+In that case categorize every document independently using the rules above and return
+one entry per document in the "results" array, with its filename copied exactly."""
+
+BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "categorizations",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "results": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "filename": {"type": "string"},
+                            "category": {"type": "string", "enum": ["people", "hardware"]},
+                            "confidence": {"type": "number"}
+                        },
+                        "required": ["filename", "category", "confidence"],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["results"],
+            "additionalProperties": False
+        }
+    }
+}
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.busy = 0.0
+        self.first_start = None
+        self.last_end = None
+
+    def record(self, start: float, end: float):
+        self.count += 1
+        self.busy += end - start
+        self.first_start = start if self.first_start is None else min(self.first_start, start)
+        self.last_end = end if self.last_end is None else max(self.last_end, end)
+
+    def summary(self) -> str:
+        if not self.count:
+            return f"{self.name}: idle"
+        span = self.last_end - self.first_start
+        return (f"{self.name}: {self.count} calls in {span:.2f}s "
+                f"({self.count / span if span else float('inf'):.2f}/s, avg {self.busy / self.count:.2f}s per call)")
+
+class Stages:
+    """One semaphore and one set of timing stats per modality."""
+
+    def __init__(self, limits: Dict[str, int]):
+        self.semaphores = {name: asyncio.Semaphore(limit) for name, limit in limits.items()}
+        self.stats = {name: StageStats(name) for name in limits}
+
+    @asynccontextmanager
+    async def run(self, name: str):
+        async with self.semaphores[name]:
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.stats[name].record(start, time.perf_counter())
+
+stages = Stages(STAGE_LIMITS)
+
+class TopK:
+    """Keeps the k most confident items per category as results stream in.
+
+    Ties on confidence go to the file listed first, which is what the stable
+    sort over the serial run's results used to do.
+    """
+
+    def __init__(self, k: int = 3):
+        self.k = k
+        self.heaps: Dict[str, list] = {"people": [], "hardware": []}
+
+    def add(self, item: Dict, order: int):
+        heap = self.heaps[item['category']]
+        # Min-heap on (confidence, -order): the root is the entry to evict next
+        entry = (item['confidence'], -order, item['filename'])
+        if len(heap) < self.k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    def result(self) -> Dict[str, List[str]]:
+        return {category: sorted(filename for _, _, filename in heap) for category, heap in self.heaps.items()}
+
+def config_fingerprint() -> str:
+    """Hash of every setting that changes what a file is classified as."""
+    config = {
+        'chat_model': CHAT_MODEL,
+        'transcription_model': TRANSCRIPTION_MODEL,
+        'system_prompt': BATCH_SYSTEM_PROMPT if BATCH_CATEGORIZATION else SYSTEM_PROMPT,
+        'image_budget': [IMAGE_MAX_PIXELS, IMAGE_MAX_BYTES],
+        'preclassifier': [PRECLASSIFY, PRECLASSIFIER_THRESHOLD],
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+class RunJournal:
+    """Append-only JSONL log of classified files, keyed by path, content hash and config fingerprint."""
+
+    def __init__(self, path: Path, config: str):
+        self.path = path
+        self.config = config
+        self.entries: Dict[tuple, List[Dict]] = {}
+        if path.exists():
+            with open(path, 'rb+') as f:
+                data = f.read()
+                complete = data.rfind(b"\n") + 1
+                if complete < len(data):
+                    # A line cut short by a crash mid-write; cut off so the next record
+                    # starts on a line of its own, and that file is simply redone
+                    f.truncate(complete)
+            for line in data[:complete].decode('utf-8').splitlines():
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.entries[(entry['path'], entry['sha256'], entry.get('config'))] = entry['results']
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def get(self, file_path: Path, sha256: str):
+        return self.entries.get((str(file_path.resolve()), sha256, self.config))
+
+    def record(self, file_path: Path, sha256: str, results: List[Dict]):
+        entry = {'path': str(file_path.resolve()), 'sha256': sha256, 'config': self.config, 'results': results}
+        self.entries[(entry['path'], sha256, self.config)] = results
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+# Updated from the prepare_image worker threads
+image_bytes = {"original": 0, "sent": 0}
+image_bytes_lock = threading.Lock()
+
+# Modes PNG can store as they are; anything else (CMYK, YCbCr, LAB, ...) becomes RGB
+PNG_MODES = ("1", "L", "LA", "I", "P", "RGB", "RGBA")
+
+def _count_image_bytes(original: int = 0, sent: int = 0):
+    with image_bytes_lock:
+        image_bytes["original"] += original
+        image_bytes["sent"] += sent
+
+# Tried in turn when an encoded image is still over IMAGE_MAX_BYTES, before it is scaled down further
+JPEG_FALLBACK_QUALITIES = (75, 60, 45)
+IMAGE_MIN_SIDE = 256
+
+def _encode_jpeg(img: Image.Image, quality: int) -> bytes:
+    buffered = BytesIO()
+    img.convert("RGB").save(buffered, format="JPEG", quality=quality)
+    return buffered.getvalue()
+
+def _encode_image(img: Image.Image) -> tuple[bytes, str]:
+    # Alpha channels and flat-colour graphics (screenshots, scans of text) stay
+    # lossless; anything photographic compresses far better as JPEG
+    if img.mode not in PNG_MODES:
+        img = img.convert("RGB")
+    if img.mode in ("RGBA", "LA", "P") or img.getcolors(maxcolors=256) is not None:
+        buffered = BytesIO()
+        img.save(buffered, format="PNG", optimize=True)
+        return buffered.getvalue(), "image/png"
+    return _encode_jpeg(img, 85), "image/jpeg"
+
+def _encode_within_budget(img: Image.Image) -> tuple[bytes, str]:
+    """Encode like _encode_image, then lower JPEG quality and scale down until IMAGE_MAX_BYTES is met."""
+    data, mime = _encode_image(img)
+    while len(data) > IMAGE_MAX_BYTES:
+        for quality in JPEG_FALLBACK_QUALITIES:
+            data, mime = _encode_jpeg(img, quality), "image/jpeg"
+            if len(data) <= IMAGE_MAX_BYTES:
+                return data, mime
+        if min(img.size) <= IMAGE_MIN_SIDE:
+            raise ValueError(f"Image still {len(data)} bytes at {img.width}x{img.height}, "
+                             f"over the {IMAGE_MAX_BYTES} byte budget")
+        img = img.resize((round(img.width * 0.75), round(img.height * 0.75)), Image.LANCZOS)
+        data, mime = _encode_image(img)
+    return data, mime
+
+def prepare_image(file_path: Path) -> tuple[bytes, str]:
+    """Return the bytes and MIME type to send for an image, downscaling only when over budget."""
+    # Hashed and decoded straight from disk; the raw bytes are only read when sent as they are
+    original_size = file_path.stat().st_size
+    _count_image_bytes(original=original_size)
+    digest = file_sha256(file_path)
+    budget_key = f"{IMAGE_MAX_PIXELS}-{IMAGE_MAX_BYTES}"
+
+    for suffix, mime in ((".png", "image/png"), (".jpg", "image/jpeg")):
+        cached = IMAGE_CACHE_DIR / f"{digest}-{budget_key}{suffix}"
+        if cached.exists():
+            data = cached.read_bytes()
+            _count_image_bytes(sent=len(data))
+            return data, mime
+
+    with Image.open(file_path) as img:
+        source_mime = Image.MIME.get(img.format)
+        if (source_mime in ("image/png", "image/jpeg")
+                and img.width * img.height <= IMAGE_MAX_PIXELS
+                and original_size <= IMAGE_MAX_BYTES):
+            _count_image_bytes(sent=original_size)
+            return file_path.read_bytes(), source_mime
+
+        img = img.copy()
+        img.thumbnail((2048, 2048))
+        short_side = min(img.size)
+        if short_side > 768:
+            scale = 768 / short_side
+            img = img.resize((round(img.width * scale), round(img.height * scale)), Image.LANCZOS)
+        data, mime = _encode_within_budget(img)
+
+    IMAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    suffix = ".png" if mime == "image/png" else ".jpg"
+    (IMAGE_CACHE_DIR / f"{digest}-{budget_key}{suffix}").write_bytes(data)
+    _count_image_bytes(sent=len(data))
+    return data, mime
+
+async def process_text_file(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read().lower()
-    return categorize_content(content, file_path.name)
+    return await categorize_content(content, file_path.name)
 
-def process_png_file(file_path):
+async def process_png_file(file_path):
     try:
-        with Image.open(file_path) as img:
-            buffered = BytesIO()
-            img.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": SYSTEM_PROMPT
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Analyze this image and return a JSON object with category and confidence score."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{img_str}"
+        data, mime = await asyncio.to_thread(prepare_image, file_path)
+        img_str = base64.b64encode(data).decode()
+
+        async with stages.run("vision"):
+            response = await async_client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": SYSTEM_PROMPT
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": "Analyze this image and return a JSON object with category and confidence score."
+                            },
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": f"data:{mime};base64,{img_str}"
+                                }
                             }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=100
-        )
+                        ]
+                    }
+                ],
+                max_tokens=100
+            )
         return parse_categorization_response(response.choices[0].message.content, file_path.name)
     except Exception as e:
         print(f"Error processing PNG {file_path.name}: {e}")
         return []
 
-def process_mp3_file(file_path):
-    try:
+SEGMENT_CACHE_DIR = Path(__file__).resolve().parent / "cache" / "segments"
+
+async def transcribe_audio(file_path: Path) -> str:
+    async with stages.run("whisper"):
         with open(file_path, 'rb') as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
+            transcript = await async_client.audio.transcriptions.create(
+                model=TRANSCRIPTION_MODEL,
                 file=audio_file,
                 language="pl"
             )
-        return categorize_content(transcript.text.lower(), file_path.name)
+    return transcript.text
+
+async def transcribe_chunked(file_path: Path) -> str:
+    # The chunker cuts and uploads segments on its own threads; each upload is handed
+    # back to the event loop so it takes a "whisper" slot like any other recording
+    loop = asyncio.get_running_loop()
+    chunker = ChunkedTranscriber(
+        lambda segment_path: asyncio.run_coroutine_threadsafe(transcribe_audio(segment_path), loop).result(),
+        SEGMENT_CACHE_DIR,
+        max_workers=STAGE_LIMITS["whisper"]
+    )
+    return await asyncio.to_thread(chunker.transcribe, file_path)
+
+async def process_mp3_file(file_path):
+    try:
+        if CHUNKED_TRANSCRIPTION or file_path.stat().st_size > WHISPER_MAX_BYTES:
+            text = await transcribe_chunked(file_path)
+        else:
+            text = await transcribe_audio(file_path)
+        # Goes straight on to categorization without waiting for other recordings
+        return await categorize_content(text.lower(), file_path.name)
     except Exception as e:
         print(f"Error processing MP3 {file_path.name}: {e}")
         return []
@@ -131,67 +436,223 @@ def parse_categorization_response(response: str, filename: str) -> List[Dict]:
         print(f"Raw response: {response}")
     return []
 
-def categorize_content(content: str, filename: str) -> List[Dict]:
+async def categorize_single(content: str, filename: str) -> List[Dict]:
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system", 
-                    "content": SYSTEM_PROMPT
-                },
-                {"role": "user", "content": content}
-            ]
-        )
+        async with stages.run("chat"):
+            response = await async_client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=[
+                    {
+                        "role": "system", 
+                        "content": SYSTEM_PROMPT
+                    },
+                    {"role": "user", "content": content}
+                ]
+            )
         return parse_categorization_response(response.choices[0].message.content, filename)
     except Exception as e:
         print(f"Error categorizing content from {filename}: {e}")
         return []
 
-def main():
-    base_path = Path('/home/oskar/3rd-devs/Exercises/S01E04/pliki_z_fabryki')
-    categorized_files = []
-    
-    for file_path in base_path.glob('*'):
-        if (file_path.is_file() 
-            and file_path.name != 'weapons_tests.zip' 
+class CategorizationBatcher:
+    """Collects documents for a short while and categorizes them in one request.
+
+    A batch is sent when the next document would push it over the token budget
+    or when it has waited BATCH_LINGER_SECONDS. Documents the model leaves out
+    of its answer are split off and retried in smaller batches, down to a
+    single-document request.
+    """
+
+    def __init__(self, token_budget: int = BATCH_TOKEN_BUDGET, linger: float = BATCH_LINGER_SECONDS):
+        self.token_budget = token_budget
+        self.linger = linger
+        self.encoding = tiktoken.encoding_for_model(CHAT_MODEL)
+        self.pending = []
+        self.pending_tokens = 0
+        self.timer = None
+        self.tasks = set()
+
+    async def categorize(self, content: str, filename: str) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        tokens = len(self.encoding.encode(content))
+        if self.pending and self.pending_tokens + tokens > self.token_budget:
+            self.flush()
+        self.pending.append((filename, content, future))
+        self.pending_tokens += tokens
+        if self.timer is None:
+            self.timer = loop.call_later(self.linger, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending, self.pending_tokens = self.pending, [], 0
+        if batch:
+            task = asyncio.create_task(self._resolve(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _resolve(self, batch):
+        results = await self._categorize_batch([(filename, content) for filename, content, _ in batch])
+        for filename, _, future in batch:
+            future.set_result(results.get(filename, []))
+
+    async def _categorize_batch(self, documents) -> Dict[str, List[Dict]]:
+        if not documents:
+            return {}
+        if len(documents) == 1:
+            filename, content = documents[0]
+            return {filename: await categorize_single(content, filename)}
+
+        body = "\n\n".join(f'<document filename="{filename}">\n{content}\n</document>' for filename, content in documents)
+        results = {}
+        try:
+            async with stages.run("chat"):
+                response = await async_client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=[
+                        {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                        {"role": "user", "content": body}
+                    ],
+                    response_format=BATCH_RESPONSE_FORMAT
+                )
+            expected = {filename for filename, _ in documents}
+            for entry in json.loads(response.choices[0].message.content)["results"]:
+                confidence = float(entry["confidence"])
+                if entry["filename"] in expected and 0 <= confidence <= 100:
+                    results[entry["filename"]] = [{
+                        'category': entry['category'],
+                        'confidence': round(confidence, 5),
+                        'filename': entry['filename']
+                    }]
+        except Exception as e:
+            print(f"Error categorizing batch of {len(documents)} documents: {e}")
+
+        missing = [doc for doc in documents if doc[0] not in results]
+        if missing:
+            print(f"Batch of {len(documents)} dropped {len(missing)} documents, retrying them")
+            half = (len(missing) + 1) // 2
+            retried = await asyncio.gather(self._categorize_batch(missing[:half]), self._categorize_batch(missing[half:]))
+            for partial in retried:
+                results.update(partial)
+        return results
+
+batcher = CategorizationBatcher() if BATCH_CATEGORIZATION else None
+preclassifier = load_preclassifier() if PRECLASSIFY else None
+preclassified = {"local": 0, "llm": 0}
+
+async def categorize_content(content: str, filename: str) -> List[Dict]:
+    local = preclassifier.predict(content, PRECLASSIFIER_THRESHOLD) if preclassifier is not None else None
+    if local is not None:
+        preclassified["local"] += 1
+        print(f"Pre-classified {filename} locally: {local}")
+        return [{**local, 'filename': filename}]
+
+    preclassified["llm"] += 1
+    if batcher is not None:
+        results = await batcher.categorize(content, filename)
+    else:
+        results = await categorize_single(content, filename)
+    # Every LLM answer becomes training data for the pre-classifier
+    sha256 = hashlib.sha256(content.encode()).hexdigest()
+    for item in results:
+        await asyncio.to_thread(record_label, sha256, filename, content, item['category'], item['confidence'])
+    return results
+
+async def process_file(file_path: Path) -> List[Dict]:
+    print(f"Processing {file_path.name}...")
+    if file_path.suffix == '.txt':
+        return await process_text_file(file_path)
+    if file_path.suffix in ['.png', '.jpeg']:
+        return await process_png_file(file_path)
+    if file_path.suffix == '.mp3':
+        return await process_mp3_file(file_path)
+    return []
+
+def list_input_files(base_path: Path) -> List[Path]:
+    return [
+        file_path for file_path in base_path.glob('*')
+        if (file_path.is_file()
+            and file_path.name != 'weapons_tests.zip'
             and file_path.name != '2024-11-12_report-99.zip'
             and file_path.name != '2024-11-12_report-99.jpeg'
             and 'facts' not in str(file_path)
-            and not file_path.suffix == '.zip'):
-            print(f"Processing {file_path.name}...")
-            
-            if file_path.suffix == '.txt':
-                results = process_text_file(file_path)
-            elif file_path.suffix in ['.png', '.jpeg']:
-                results = process_png_file(file_path)
-            elif file_path.suffix == '.mp3':
-                results = process_mp3_file(file_path)
-            else:
-                continue
-                
+            and not file_path.suffix == '.zip')
+    ]
+
+async def list_archives(base_path: Path) -> List[Path]:
+    # Same scan, cache and exclusions as pliki_z_fabryki/main.py, so files it already scanned are not read again
+    cache_dir = base_path / "cache"
+    report = await asyncio.to_thread(
+        scan_directory, base_path, cache_path=cache_dir / "scan_cache.json",
+        exclude=[base_path / "scan_report.json", cache_dir])
+    return [
+        base_path / entry["path"] for entry in report["files"]
+        if '/' not in entry["path"] and (entry["path"].endswith('.zip') or entry["action"] == 'unpack')
+    ]
+
+async def extracted_members(archives: List[Path]):
+    """Yield archive members one by one as soon as each is on disk, skipping identical copies"""
+    extractor = StreamingExtractor(ARCHIVE_DIR, password=ARCHIVE_PASSWORD.encode() if ARCHIVE_PASSWORD else None)
+    for archive in archives:
+        members = extractor.extract(archive)
+        while True:
+            try:
+                member = await asyncio.to_thread(next, members, None)
+            except (ArchiveLimitError, zipfile.BadZipFile) as e:
+                print(f"Stopped unpacking {archive.name}: {e}")
+                break
+            if member is None:
+                break
+            if not member.duplicate:
+                yield member
+
+async def classify_directory(base_path: Path) -> Dict[str, List[str]]:
+    files = list_input_files(base_path)
+    top = TopK(3)
+    journal = RunJournal(JOURNAL_PATH, config_fingerprint())
+    resumed = 0
+    started = time.perf_counter()
+
+    async def classify(order: int, file_path: Path):
+        nonlocal resumed
+        sha256 = await asyncio.to_thread(file_sha256, file_path)
+        results = journal.get(file_path, sha256)
+        if results is not None:
+            resumed += 1
+        else:
+            results = await process_file(file_path)
+            # Empty results mean the file failed; leaving it out of the journal retries it next run
             if results:
-                categorized_files.extend(results)
+                journal.record(file_path, sha256, results)
                 print(f"Processed {file_path.name} with results: {results}")
-    
-    # Sort by confidence and take top 3 for each category
-    result = {
-        "people": [],
-        "hardware": []
-    }
-    
-    # Sort files by confidence
-    categorized_files.sort(key=lambda x: x.get('confidence', 0), reverse=True)
-    
-    # Take top 3 for each category
-    for item in categorized_files:
-        category = item['category']
-        if len(result[category]) < 3:
-            result[category].append(item['filename'])
-    
-    # Sort filenames alphabetically within each category
-    result["people"].sort()
-    result["hardware"].sort()
+        for item in results:
+            top.add(item, order)
+
+    try:
+        tasks = [asyncio.create_task(classify(order, file_path)) for order, file_path in enumerate(files)]
+        if UNPACK_ARCHIVES:
+            # Members start classifying while the rest of the archive is still being unpacked
+            async for member in extracted_members(await list_archives(base_path)):
+                tasks.append(asyncio.create_task(classify(len(tasks), member.path)))
+        await asyncio.gather(*tasks)
+    finally:
+        journal.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"\nClassified {len(tasks)} files in {elapsed:.2f}s ({resumed} taken from {JOURNAL_PATH.name})")
+    for stats in stages.stats.values():
+        print(f"  {stats.summary()}")
+    print(f"  pre-classifier: {preclassified['local']} documents answered locally, {preclassified['llm']} sent to the LLM")
+    saved = image_bytes["original"] - image_bytes["sent"]
+    print(f"  images: {image_bytes['original']} bytes read, {image_bytes['sent']} sent, {saved} saved")
+    return top.result()
+
+def main():
+    base_path = Path('/home/oskar/3rd-devs/Exercises/S01E04/pliki_z_fabryki')
+    result = asyncio.run(classify_directory(base_path))
     
     print("\nFinal categorization:")
     print(json.dumps(result, indent=2, ensure_ascii=False))
@@ -0,0 +1,188 @@
+"""Local first-stage people/hardware classifier that lets obvious documents skip the LLM.
+
+Once enough LLM labels have been collected it fits a TF-IDF logistic regression
+on them, and only that trained model may answer instead of the LLM. Until then
+documents are scored with a small keyword lexicon, which is used for the
+agreement report but never to skip the LLM. Run this file directly to see, per
+threshold, how many labelled documents would have skipped the API and how often
+it agrees with the LLM.
+
+A full run over pliki_z_fabryki labels at most 13 documents (10 text notes and
+3 transcripts; images go to the vision model). That is below
+MIN_TRAINING_LABELS, so on this corpus PRECLASSIFY=1 changes nothing until
+labels from more documents (e.g. UNPACK_ARCHIVES=1 runs) have been collected.
+Fewer labels are not enough to trust a model that replaces the LLM's answer.
+"""
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.retrieval import tokenize
+
+LABELS_PATH = Path(__file__).resolve().parent / "cache" / "llm_labels.jsonl"
+
+# Only confident LLM answers are used as training targets; documents that are
+# about neither category come back with low confidence and would only add noise
+MIN_LABEL_CONFIDENCE = 0.6
+MIN_TRAINING_LABELS = 20
+
+# Matched as prefixes of the tokens produced by common.retrieval.tokenize
+PEOPLE_KEYWORDS = (
+    "odcisk", "palc", "biomet", "osobni", "zatrzym", "schwyt", "aresz", "ujęt", "intruz",
+    "człowie", "ludzk", "osob", "przedstaw", "dna", "ślad",
+)
+HARDWARE_KEYWORDS = (
+    "napraw", "wymian", "wymien", "usterk", "awari", "uszkodz", "podzesp", "komponen", "przewod",
+    "przewód", "zwarci", "silnik", "bateri", "ogniw", "anten", "serwis", "konserw", "łożysk",
+)
+# A keyword right after one of these ("brak osób", "nie wykryto usterki") does not count
+NEGATIONS = ("brak", "nie", "bez", "żadn", "zero")
+NEGATION_WINDOW = 2
+
+
+def _keyword_hits(text: str, keywords) -> List[bool]:
+    # Tokens are cut to six characters, so compare only as much as both sides have
+    tokens = tokenize(text)
+    return [
+        any(token.startswith(k[:len(token)]) and len(token) >= min(len(k), 3) for k in keywords)
+        and not any(previous.startswith(NEGATIONS) for previous in tokens[max(0, i - NEGATION_WINDOW):i])
+        for i, token in enumerate(tokens)
+    ]
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+class PreClassifier:
+    def __init__(self):
+        self.vocabulary: Optional[Dict[str, int]] = None
+        self.idf = None
+        self.weights = None
+        self.bias = 0.0
+
+    @property
+    def trained(self) -> bool:
+        return self.weights is not None
+
+    def _features(self, texts: List[str]) -> np.ndarray:
+        counts = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float64)
+        for row, text in enumerate(texts):
+            for term in tokenize(text):
+                column = self.vocabulary.get(term)
+                if column is not None:
+                    counts[row, column] += 1
+        tfidf = np.log1p(counts) * self.idf
+        norms = np.linalg.norm(tfidf, axis=1, keepdims=True)
+        return tfidf / np.maximum(norms, 1e-12)
+
+    def fit(self, texts: List[str], categories: List[str], epochs: int = 500, learning_rate: float = 2.0,
+            l2: float = 1e-3) -> "PreClassifier":
+        tokenized = [set(tokenize(text)) for text in texts]
+        self.vocabulary = {term: i for i, term in enumerate(sorted(set().union(*tokenized)))}
+        document_frequency = np.zeros(len(self.vocabulary))
+        for terms in tokenized:
+            document_frequency[[self.vocabulary[t] for t in terms]] += 1
+        self.idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+
+        X = self._features(texts)
+        y = np.array([category == "hardware" for category in categories], dtype=np.float64)
+        self.weights = np.zeros(X.shape[1])
+        self.bias = 0.0
+        for _ in range(epochs):
+            error = _sigmoid(X @ self.weights + self.bias) - y
+            self.weights -= learning_rate * (X.T @ error / len(y) + l2 * self.weights)
+            self.bias -= learning_rate * error.mean()
+        return self
+
+    def hardware_probability(self, texts: List[str]) -> np.ndarray:
+        if self.trained:
+            return _sigmoid(self._features(texts) @ self.weights + self.bias)
+        # Keyword fallback: every extra hit on one side moves the score by 1.5 logits
+        scores = np.array([
+            sum(_keyword_hits(text, HARDWARE_KEYWORDS)) - sum(_keyword_hits(text, PEOPLE_KEYWORDS))
+            for text in texts
+        ], dtype=np.float64)
+        return _sigmoid(1.5 * scores)
+
+    def predict(self, text: str, threshold: float) -> Optional[Dict]:
+        """Return a categorization when the trained model is at least `threshold` sure, else None."""
+        if not self.trained:
+            return None
+        hardware = float(self.hardware_probability([text])[0])
+        category, confidence = ("hardware", hardware) if hardware >= 0.5 else ("people", 1 - hardware)
+        if confidence < threshold:
+            return None
+        return {'category': category, 'confidence': round(confidence, 5)}
+
+
+def load_labels(path: Path = LABELS_PATH) -> List[Dict]:
+    """Latest confident LLM label per distinct document content."""
+    if not path.exists():
+        return []
+    labels = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                label = json.loads(line)
+                labels[label['sha256']] = label
+    return [label for label in labels.values() if label['confidence'] >= MIN_LABEL_CONFIDENCE]
+
+
+def record_label(sha256: str, filename: str, content: str, category: str, confidence: float,
+                 path: Path = LABELS_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({
+            'sha256': sha256,
+            'filename': filename,
+            'category': category,
+            'confidence': confidence,
+            'content': content
+        }, ensure_ascii=False) + "\n")
+
+
+def load_preclassifier() -> PreClassifier:
+    labels = load_labels()
+    categories = {label['category'] for label in labels}
+    if len(labels) >= MIN_TRAINING_LABELS and len(categories) == 2:
+        print(f"Pre-classifier trained on {len(labels)} cached LLM labels")
+        return PreClassifier().fit([l['content'] for l in labels], [l['category'] for l in labels])
+    print(f"Pre-classifier not trained yet ({len(labels)} of {MIN_TRAINING_LABELS} usable LLM labels in "
+          f"{LABELS_PATH.name}); PRECLASSIFY=1 has no effect until then and every document goes to the LLM")
+    return PreClassifier()
+
+
+def agreement_report(thresholds=(0.7, 0.8, 0.9, 0.95, 0.99), folds: int = 5):
+    """Cross-validated coverage and agreement with the LLM for each threshold."""
+    labels = load_labels()
+    if not labels:
+        print(f"No LLM labels in {LABELS_PATH}; run main.py first")
+        return
+    texts = [l['content'] for l in labels]
+    categories = np.array([l['category'] for l in labels])
+    hardware = np.zeros(len(labels))
+    order = np.random.default_rng(0).permutation(len(labels))
+    for fold in np.array_split(order, min(folds, len(labels))):
+        train = np.setdiff1d(order, fold)
+        model = PreClassifier()
+        if len(set(categories[train])) == 2 and len(train) >= MIN_TRAINING_LABELS:
+            model.fit([texts[i] for i in train], list(categories[train]))
+        hardware[fold] = model.hardware_probability([texts[i] for i in fold])
+
+    predicted = np.where(hardware >= 0.5, "hardware", "people")
+    confidence = np.maximum(hardware, 1 - hardware)
+    print(f"{len(labels)} labelled documents")
+    print("threshold  skipped  agreement")
+    for threshold in thresholds:
+        skipped = confidence >= threshold
+        agreement = (predicted[skipped] == categories[skipped]).mean() if skipped.any() else float('nan')
+        print(f"{threshold:9.2f}  {skipped.mean():7.1%}  {agreement:9.1%}")
+
+
+if __name__ == "__main__":
+    agreement_report()
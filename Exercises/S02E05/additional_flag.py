@@ -1,5 +1,9 @@
 import base64
-from itertools import cycle
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.xor_cipher import xor_bytes
 
 cipher_b64 = "GhUiPj1fKTM3NCY1KSUmNxkP"
 key = b"andrzej"
@@ -7,7 +11,8 @@ key = b"andrzej"
 # 1. Base-64
 cipher_bytes = base64.b64decode(cipher_b64)
 
-# 2. Repeating XOR
-plain = bytes(c ^ k for c, k in zip(cipher_bytes, cycle(key)))
+# 2. Repeating XOR (common.xor_cipher.recover_key finds the key when it is not known,
+#    given a few hundred bytes of ciphertext)
+plain = xor_bytes(cipher_bytes, key)
 
-print(plain.decode())
\ No newline at end of file
+print(plain.decode())
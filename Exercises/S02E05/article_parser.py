@@ -0,0 +1,213 @@
+"""Single-pass article extraction with lxml.
+
+The HTML is fed to lxml's C parser in chunks and handled through parser target
+callbacks, so no element tree is built. Text blocks, media references and the
+plain text of the whole page all come out of the same pass.
+"""
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+from urllib.parse import urljoin
+
+from lxml import etree
+
+HEADING_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+TEXT_TAGS = ('p', 'li', 'pre', 'blockquote', 'figcaption', 'td')
+# Text outside every heading/text tag (loose in a <div>, <body>, ...) is collected into
+# blocks of this tag; inline tags continue such a block, any other tag ends it
+LOOSE_TAG = 'text'
+INLINE_TAGS = ('a', 'abbr', 'b', 'cite', 'code', 'em', 'i', 'kbd', 'mark', 'q', 's', 'small', 'span',
+               'strong', 'sub', 'sup', 'time', 'u', 'var')
+MEDIA_TAGS = {'img': 'image', 'audio': 'audio'}
+# Left out of the plain text, the same as BeautifulSoup's get_text()
+HIDDEN_TAGS = ('script', 'style', 'template')
+
+READ_CHUNK_BYTES = 64 * 1024
+# Part of the ArticleStore key, so documents cached by an older extraction are parsed again
+PARSER_VERSION = 2
+
+
+@dataclass
+class TextBlock:
+    position: int
+    tag: str
+    section: str
+    text: str
+
+
+@dataclass
+class MediaRef:
+    position: int
+    kind: str
+    url: str
+    alt: str
+    section: str
+
+
+@dataclass
+class ArticleDocument:
+    sha256: str
+    base_url: str
+    blocks: List[TextBlock] = field(default_factory=list)
+    media: List[MediaRef] = field(default_factory=list)
+    # Plain text of the whole page, like soup.get_text()
+    text: str = ""
+
+    def images(self) -> List[MediaRef]:
+        return [ref for ref in self.media if ref.kind == 'image']
+
+    def audio(self) -> List[MediaRef]:
+        return [ref for ref in self.media if ref.kind == 'audio']
+
+    def elements(self) -> List:
+        """Blocks and media together, in document order"""
+        return sorted(self.blocks + self.media, key=lambda element: element.position)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ArticleDocument":
+        return cls(
+            sha256=data['sha256'],
+            base_url=data['base_url'],
+            blocks=[TextBlock(**block) for block in data['blocks']],
+            media=[MediaRef(**ref) for ref in data['media']],
+            text=data['text'],
+        )
+
+
+class _ExtractionTarget:
+    """lxml parser target that builds an ArticleDocument from start/end/data events"""
+
+    def __init__(self, document: ArticleDocument):
+        self.document = document
+        self.position = 0
+        self.section = ""
+        self.hidden_depth = 0
+        # The outermost open heading or text tag: (tag, position, stripped strings)
+        self.block: Optional[tuple] = None
+        self.block_depth = 0
+        # Loose text since the last block boundary: (position, stripped strings)
+        self.loose: Optional[tuple] = None
+        self.pending: List[str] = []
+        self.text: List[str] = []
+
+    def _flush(self):
+        # lxml may split one text node over several data() calls
+        if not self.pending:
+            return
+        string = "".join(self.pending)
+        self.pending = []
+        if self.hidden_depth:
+            return
+        self.text.append(string)
+        if not string.strip():
+            return
+        if self.block:
+            self.block[2].append(string.strip())
+            return
+        if self.loose is None:
+            # A position of its own, so it sorts between the elements around it
+            self.position += 1
+            self.loose = (self.position, [])
+        self.loose[1].append(string.strip())
+
+    def _end_loose(self):
+        if self.loose is None:
+            return
+        position, strings = self.loose
+        self.loose = None
+        self.document.blocks.append(TextBlock(position=position, tag=LOOSE_TAG, section=self.section,
+                                              text=" ".join(strings)))
+
+    def start(self, tag, attrib):
+        self._flush()
+        if tag not in INLINE_TAGS:
+            self._end_loose()
+        self.position += 1
+        if tag in HIDDEN_TAGS:
+            self.hidden_depth += 1
+        if tag in HEADING_TAGS or tag in TEXT_TAGS:
+            if self.block is None:
+                self.block = (tag, self.position, [])
+                self.block_depth = 0
+            elif tag == self.block[0]:
+                self.block_depth += 1
+        if tag in MEDIA_TAGS and attrib.get('src'):
+            self.document.media.append(MediaRef(
+                position=self.position,
+                kind=MEDIA_TAGS[tag],
+                url=urljoin(self.document.base_url, attrib['src']),
+                alt=attrib.get('alt', ''),
+                section=self.section,
+            ))
+
+    def end(self, tag):
+        self._flush()
+        if tag not in INLINE_TAGS:
+            self._end_loose()
+        if tag in HIDDEN_TAGS:
+            self.hidden_depth = max(self.hidden_depth - 1, 0)
+        if self.block is None or tag != self.block[0]:
+            return
+        if self.block_depth:
+            self.block_depth -= 1
+            return
+        block_tag, position, strings = self.block
+        self.block = None
+        text = " ".join(strings)
+        if block_tag in HEADING_TAGS:
+            self.section = text
+        self.document.blocks.append(TextBlock(position=position, tag=block_tag, section=self.section, text=text))
+
+    def data(self, data):
+        self.pending.append(data)
+
+    def comment(self, text):
+        self._flush()
+
+    def close(self):
+        self._flush()
+        self._end_loose()
+        self.document.text = "".join(self.text)
+        return self.document
+
+
+def parse_article(path: str, base_url: str, sha256: str, encoding: Optional[str] = None) -> ArticleDocument:
+    """Extract an ArticleDocument from an HTML file in one streaming pass"""
+    target = _ExtractionTarget(ArticleDocument(sha256=sha256, base_url=base_url))
+    parser = etree.HTMLParser(target=target, encoding=encoding, remove_comments=True)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            parser.feed(chunk)
+    return parser.close()
+
+
+class ArticleStore:
+    """Parsed articles memoized per document hash, in memory and as JSON on disk"""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self._documents: Dict[str, ArticleDocument] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def load(self, path: str, base_url: str, sha256: str, encoding: Optional[str] = None) -> ArticleDocument:
+        # Media URLs are resolved against base_url, so it is part of the key
+        key = hashlib.sha256(f"{sha256}\n{base_url}\n{PARSER_VERSION}".encode()).hexdigest()
+        if key in self._documents:
+            return self._documents[key]
+        cache_file = os.path.join(self.cache_dir, f"article_{key}.json")
+        if os.path.exists(cache_file):
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                document = ArticleDocument.from_dict(json.load(f))
+        else:
+            document = parse_article(path, base_url, sha256, encoding)
+            tmp_path = cache_file + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(asdict(document), f, ensure_ascii=False)
+            os.replace(tmp_path, cache_file)
+        self._documents[key] = document
+        return document
@@ -0,0 +1,110 @@
+"""Parse time and peak memory: lxml single-pass extraction vs BeautifulSoup html.parser.
+
+Usage: python benchmark_parse.py [--sections 2000] [--file draft.html] [--repeat 3]
+
+Without --file a synthetic draft is generated with the given number of sections
+(each a heading, a few paragraphs, a list, an image and sometimes audio). Each
+parser runs in its own process so the peak RSS of one does not hide the other.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+
+from article_parser import HEADING_TAGS, LOOSE_TAG, TEXT_TAGS, parse_article
+
+BASE_URL = "https://c3ntrala.ag3nts.org/dane/arxiv-draft.html"
+
+
+def synthetic_draft(sections: int) -> str:
+    parts = ["<html><head><title>Draft</title><style>p { margin: 0 }</style></head><body>"]
+    for i in range(sections):
+        parts.append(f"<h2>Sekcja {i}</h2>")
+        for j in range(4):
+            parts.append(f"<p>Akapit {j} sekcji {i}: <b>Rafał</b> przeniósł się w czasie, "
+                         f"a <a href='#r{j}'>wyniki</a> opisano w tabeli {i}.{j}.</p>")
+        parts.append(f"<ul><li><p>Punkt pierwszy {i}</p></li><li>Punkt drugi {i}</li></ul>")
+        parts.append(f"<figure><img src='i/fig{i}.png' alt='Rysunek {i}'>"
+                     f"<figcaption>Podpis rysunku {i}</figcaption></figure>")
+        if i % 10 == 0:
+            parts.append(f"<audio controls src='i/rec{i}.mp3'></audio>")
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+def bs4_extract(path: str):
+    """The previous path: a full html.parser tree, then separate walks over it"""
+    from bs4 import BeautifulSoup
+    with open(path, 'r', encoding='utf-8') as f:
+        soup = BeautifulSoup(f.read(), 'html.parser')
+    images = [(img.get('src'), img.get('alt', '')) for img in soup.find_all('img') if img.get('src')]
+    audio = [a.get('src') for a in soup.find_all('audio') if a.get('src')]
+    blocks = [
+        element.get_text(" ", strip=True)
+        for element in soup.find_all(list(HEADING_TAGS) + list(TEXT_TAGS))
+        if element.name in HEADING_TAGS or not element.find_parent(list(TEXT_TAGS))
+    ]
+    return len(blocks), len(images), len(audio), len(soup.get_text())
+
+
+def lxml_extract(path: str):
+    document = parse_article(path, BASE_URL, sha256="benchmark", encoding='utf-8')
+    # Loose-text blocks have no counterpart in the find_all() above
+    blocks = [block for block in document.blocks if block.tag != LOOSE_TAG]
+    return len(blocks), len(document.images()), len(document.audio()), len(document.text)
+
+
+PARSERS = {'bs4 html.parser': bs4_extract, 'lxml single pass': lxml_extract}
+
+
+def _measure(name: str, path: str, repeat: int, results):
+    extract = PARSERS[name]
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        counts = extract(path)
+        timings.append(time.perf_counter() - start)
+    # tracemalloc only sees Python allocations, so it runs separately from the timing
+    tracemalloc.start()
+    extract(path)
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss
+    results.put((name, min(timings), python_peak, rss_growth * 1024, counts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", type=int, default=2000)
+    parser.add_argument("--file", help="HTML draft to parse instead of a synthetic one")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    path = args.file
+    if path is None:
+        with tempfile.NamedTemporaryFile('w', suffix='.html', encoding='utf-8', delete=False) as f:
+            f.write(synthetic_draft(args.sections))
+            path = f.name
+    print(f"Document: {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+
+    results = multiprocessing.Queue()
+    print(f"{'parser':<18} {'best time':>10} {'python peak':>12} {'rss growth':>11}  blocks/images/audio/text chars")
+    try:
+        for name in PARSERS:
+            process = multiprocessing.Process(target=_measure, args=(name, path, args.repeat, results))
+            process.start()
+            name, best, python_peak, rss_growth, counts = results.get()
+            process.join()
+            print(f"{name:<18} {best * 1000:8.1f}ms {python_peak / 1024 / 1024:10.1f}MB "
+                  f"{rss_growth / 1024 / 1024:9.1f}MB  {'/'.join(map(str, counts))}")
+    finally:
+        if args.file is None:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
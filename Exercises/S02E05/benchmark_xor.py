@@ -0,0 +1,89 @@
+"""Repeating-key XOR on large inputs: NumPy engine vs the generator, plus key recovery.
+
+Usage: python benchmark_xor.py [--size-mb 100] [--key "tajny klucz"] [--workers 4]
+
+Writes a --size-mb file of English/Polish text, encrypts it with xor_file, times
+the old generator on a slice and extrapolates, recovers the key from the
+memory-mapped ciphertext with one worker and with --workers, and checks that
+decrypting with the recovered key gives back the original file.
+"""
+import argparse
+import mmap
+import os
+import sys
+import tempfile
+import time
+from itertools import cycle
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.hashing import file_sha256
+from common.xor_cipher import recover_key, xor_file
+
+WORDS = (
+    "rafał przeniósł się w czasie do roku dwa tysiące badania nad modelami językowymi prowadził "
+    "profesor andrzej maj na uniwersytecie w krakowie laboratorium robotów fabryka sektor "
+    "the quick brown fox jumps over the lazy dog while researchers wrote about time travel "
+    "because their language models would answer every question which they asked there"
+).split()
+
+GENERATOR_SAMPLE_BYTES = 4 * 1024 * 1024
+
+
+def write_plaintext(path: Path, size: int, seed: int = 0):
+    # 1 MB of random word text, repeated up to the requested size
+    rng = np.random.default_rng(seed)
+    unit = bytearray()
+    while len(unit) < 1024 * 1024:
+        unit += (" ".join(rng.choice(WORDS, 1000)) + ".\n").encode()
+    with open(path, "wb") as f:
+        written = 0
+        while written < size:
+            chunk = unit[:size - written]
+            f.write(chunk)
+            written += len(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--key", default="tajny klucz 42")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    key = args.key.encode()
+    size = args.size_mb * 1024 * 1024
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_path, cipher_path, decrypted_path = (Path(tmp) / name for name in ("plain", "cipher", "decrypted"))
+        write_plaintext(plain_path, size)
+
+        start = time.perf_counter()
+        xor_file(plain_path, cipher_path, key)
+        numpy_seconds = time.perf_counter() - start
+
+        with open(cipher_path, "rb") as f:
+            sample = f.read(GENERATOR_SAMPLE_BYTES)
+        start = time.perf_counter()
+        bytes(c ^ k for c, k in zip(sample, cycle(key)))
+        generator_seconds = (time.perf_counter() - start) * size / len(sample)
+
+        print(f"XOR of {args.size_mb} MB: numpy {numpy_seconds:.2f} s ({args.size_mb / numpy_seconds:.0f} MB/s), "
+              f"generator ~{generator_seconds:.1f} s (extrapolated from {len(sample) // 1024 // 1024} MB), "
+              f"{generator_seconds / numpy_seconds:.0f}x faster")
+
+        with open(cipher_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as ciphertext:
+            for workers in sorted({1, args.workers}):
+                start = time.perf_counter()
+                recovered, score = recover_key(ciphertext, max_workers=workers)
+                print(f"Key recovery with {workers} worker(s): {time.perf_counter() - start:.2f} s, "
+                      f"key {recovered!r} ({'correct' if recovered == key else 'WRONG'}), score {score:.3f}")
+
+        xor_file(cipher_path, decrypted_path, recovered)
+        matches = file_sha256(decrypted_path) == file_sha256(plain_path)
+        print(f"Decrypting with the recovered key restores the original: {matches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Download cache that revalidates with ETag / Last-Modified instead of re-downloading."""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+
+DOWNLOAD_CHUNK_BYTES = 256 * 1024
+
+
+@dataclass
+class CachedDownload:
+    url: str
+    path: str
+    sha256: str
+    content_type: str
+    encoding: Optional[str]
+    # True when the server answered 304 and the stored body was reused
+    from_cache: bool
+
+    def read_bytes(self) -> bytes:
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def read_text(self) -> str:
+        return self.read_bytes().decode(self.encoding or 'utf-8', errors='replace')
+
+
+def url_key(url: str) -> str:
+    # URLs can carry API keys, so index.json only ever holds their hashes
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+class HttpCache:
+    """Bodies are stored by content hash; index.json maps each URL hash to its body and validators.
+
+    Least recently used URLs are evicted once the stored bodies exceed max_bytes.
+    That happens only when the cache is opened, so no body can disappear while a
+    worker is still reading a CachedDownload.path handed out during the run.
+    """
+
+    def __init__(self, session: requests.Session, cache_dir: str, max_bytes: int = 500 * 1024 * 1024):
+        self.session = session
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = {}
+        migrated = False
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                for key, entry in json.load(f).items():
+                    # Indexes written before the keys were hashed still have plain URLs
+                    if '://' in key:
+                        key = url_key(key)
+                        migrated = True
+                    self.index[key] = entry
+        with self._lock:
+            if self._evict() or migrated:
+                self._save_index()
+
+    def _body_path(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, sha256)
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+
+    def fetch(self, url: str) -> CachedDownload:
+        with self._lock:
+            entry = self.index.get(url_key(url))
+        if entry and not os.path.exists(self._body_path(entry['sha256'])):
+            entry = None
+
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        with self.session.get(url, headers=headers, stream=True) as response:
+            if entry and response.status_code == 304:
+                return self._store(url, entry, from_cache=True)
+            response.raise_for_status()
+
+            # The body goes straight to disk and is hashed on the way, so memory
+            # use stays the same however large the download is
+            digest = hashlib.sha256()
+            size = 0
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    for block in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                        digest.update(block)
+                        size += len(block)
+                        f.write(block)
+                sha256 = digest.hexdigest()
+                os.replace(tmp_path, self._body_path(sha256))
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+        entry = {
+            'sha256': sha256,
+            'size': size,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'content_type': response.headers.get('content-type', ''),
+            'encoding': response.encoding,
+        }
+        return self._store(url, entry, from_cache=False)
+
+    def _store(self, url: str, entry: dict, from_cache: bool) -> CachedDownload:
+        with self._lock:
+            entry['last_access'] = time.time()
+            self.index[url_key(url)] = entry
+            self._save_index()
+        return CachedDownload(
+            url=url,
+            path=self._body_path(entry['sha256']),
+            sha256=entry['sha256'],
+            content_type=entry['content_type'],
+            encoding=entry.get('encoding'),
+            from_cache=from_cache,
+        )
+
+    def _evict(self) -> bool:
+        """Drop the oldest entries until the bodies fit in max_bytes; True if anything went."""
+        # Sizes are counted per stored body, since several URLs can share one
+        sizes = {entry['sha256']: entry['size'] for entry in self.index.values()}
+        total = sum(sizes.values())
+        evicted = False
+        for key, entry in sorted(self.index.items(), key=lambda item: item[1]['last_access']):
+            if total <= self.max_bytes:
+                break
+            del self.index[key]
+            evicted = True
+            if all(other['sha256'] != entry['sha256'] for other in self.index.values()):
+                total -= entry['size']
+                body_path = self._body_path(entry['sha256'])
+                if os.path.exists(body_path):
+                    os.remove(body_path)
+        return evicted
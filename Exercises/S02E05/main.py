@@ -1,20 +1,28 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import os
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-import io
 import base64
-from openai import OpenAI
 import hashlib
 import time
-from openai import OpenAI
+import sys
+from pathlib import Path
 import dotenv
+import numpy as np
+import tiktoken
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.llm_client import get_client
+from common.retrieval import BM25Index, pack_passages
+from http_cache import HttpCache
+from article_parser import HEADING_TAGS, ArticleStore
 
 dotenv.load_dotenv(dotenv_path="../.env")
 
 class ArxivTask:
-    def __init__(self):
+    def __init__(self, image_workers=4, audio_workers=2):
         self.api_key = os.getenv("DV_API_KEY")
         self.base_url = "https://c3ntrala.ag3nts.org"
         self.cache_dir = "cache"
@@ -26,150 +34,176 @@ class ArxivTask:
             os.makedirs(self.cache_dir)
             
         # Initialize OpenAI client
-        self.client = OpenAI()
+        self.client = get_client()
+
+        # One keep-alive session for every download, with enough pooled
+        # connections for all media workers running at once
+        self.image_workers = image_workers
+        self.audio_workers = audio_workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=image_workers + audio_workers + 2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # Downloads are revalidated with ETag / Last-Modified instead of re-fetched
+        self.http_cache = HttpCache(self.session, os.path.join(self.cache_dir, "http"))
+        self.articles = ArticleStore(os.path.join(self.cache_dir, "articles"))
         
     def get_article_content(self):
-        """Fetch and parse the article content"""
-        response = requests.get(self.article_url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        return soup
-        
-    def process_images(self, soup):
-        """Process images in the article"""
-        images = soup.find_all('img')
-        image_descriptions = []
-        
-        for img in images:
-            img_url = img.get('src')
-            if not img_url:
-                continue
-                
-            # Convert relative URL to absolute URL
-            if not img_url.startswith(('http://', 'https://')):
-                img_url = f"{self.base_url}/dane/{img_url}"
-                
-            # Create cache key for image
-            cache_key = hashlib.md5(img_url.encode()).hexdigest()
-            cache_file = os.path.join(self.cache_dir, f"img_{cache_key}.txt")
+        """Fetch the article and extract its text blocks and media in one pass"""
+        download = self.http_cache.fetch(self.article_url)
+        return self.articles.load(download.path, self.article_url, download.sha256, download.encoding)
+
+    def _cached_result(self, prefix, download):
+        """Return the cached description/transcription for a downloaded body, if any"""
+        # Results are keyed by content hash, so a changed file at the same URL is redone.
+        # The older URL-keyed {prefix}_{md5(url)}.txt files are not taken over: nothing
+        # records which body they were made from
+        cache_file = os.path.join(self.cache_dir, f"{prefix}_{download.sha256}.txt")
+        if os.path.exists(cache_file):
+            with open(cache_file, 'r') as f:
+                return cache_file, f.read()
+        return cache_file, None
+
+    def _describe_image(self, img_url):
+        """Download one image and describe it, or return None if it can't be used"""
+        try:
+            # Download (or revalidate) the image
+            download = self.http_cache.fetch(img_url)
             
-            if os.path.exists(cache_file):
-                with open(cache_file, 'r') as f:
-                    description = f.read()
-            else:
-                try:
-                    # Download and process image
-                    img_response = requests.get(img_url)
-                    img_response.raise_for_status()  # Raise an exception for bad status codes
-                    
-                    # Check if the response is actually an image
-                    content_type = img_response.headers.get('content-type', '')
-                    if not content_type.startswith('image/'):
-                        print(f"Warning: URL {img_url} returned non-image content type: {content_type}")
-                        continue
-                    
-                    img_data = Image.open(io.BytesIO(img_response.content))
-                    
-                    response = self.client.chat.completions.create(
-                        model="o3",
-                        messages=[
+            # Check if the response is actually an image
+            if not download.content_type.startswith('image/'):
+                print(f"Warning: URL {img_url} returned non-image content type: {download.content_type}")
+                return None
+
+            cache_file, description = self._cached_result("img", download)
+            if description is not None:
+                return description
+
+            # Opening from the path only reads the header, which is enough to reject broken files
+            with Image.open(download.path):
+                pass
+            # The raw bytes are dropped as soon as they are encoded
+            with open(download.path, 'rb') as image_file:
+                image_base64 = base64.b64encode(image_file.read()).decode()
+            
+            response = self.client.chat.completions.create(
+                model="o3",
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": "Describe this image in detail, focusing on any text, diagrams, or important visual elements."},
                             {
-                                "role": "user",
-                                "content": [
-                                    {"type": "text", "text": "Describe this image in detail, focusing on any text, diagrams, or important visual elements."},
-                                    {
-                                        "type": "image_url",
-                                        "image_url": {
-                                            "url": f"data:image/jpeg;base64,{base64.b64encode(img_response.content).decode()}"
-                                        }
-                                    }
-                                ]
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": f"data:image/jpeg;base64,{image_base64}"
+                                }
                             }
-                        ],
-                        max_tokens=300
-                    )
-                    
-                    description = response.choices[0].message.content
-                    
-                    # Cache the description
-                    with open(cache_file, 'w') as f:
-                        f.write(description)
-                        
-                except requests.exceptions.RequestException as e:
-                    print(f"Error downloading image from {img_url}: {str(e)}")
-                    continue
-                except Exception as e:
-                    print(f"Error processing image from {img_url}: {str(e)}")
-                    continue
-            
-            image_descriptions.append({
-                'url': img_url,
-                'description': description,
-                'caption': img.get('alt', '')
-            })
+                        ]
+                    }
+                ],
+                max_tokens=300
+            )
             
-        return image_descriptions
-        
-    def process_audio(self, soup):
-        """Process audio files in the article"""
-        audio_files = soup.find_all('audio')
-        audio_transcriptions = []
-        
-        for audio in audio_files:
-            audio_url = audio.get('src')
-            if not audio_url:
-                continue
-                
-            # Create cache key for audio
-            cache_key = hashlib.md5(audio_url.encode()).hexdigest()
-            cache_file = os.path.join(self.cache_dir, f"audio_{cache_key}.txt")
+            description = response.choices[0].message.content
             
-            if os.path.exists(cache_file):
-                with open(cache_file, 'r') as f:
-                    transcription = f.read()
-            else:
-                # Download and process audio
-                audio_response = requests.get(audio_url)
-                audio_data = io.BytesIO(audio_response.content)
+            # Cache the description
+            with open(cache_file, 'w') as f:
+                f.write(description)
+            return description
                 
-                # Transcribe using Whisper
+        except requests.exceptions.RequestException as e:
+            print(f"Error downloading image from {img_url}: {str(e)}")
+        except Exception as e:
+            print(f"Error processing image from {img_url}: {str(e)}")
+        return None
+
+    def process_images(self, document):
+        """Process images in the article"""
+        images = document.images()
+        urls = [image.url for image in images]
+
+        # Failures come back as None, so one bad image doesn't hold up the rest
+        with ThreadPoolExecutor(max_workers=self.image_workers) as executor:
+            descriptions = list(executor.map(self._describe_image, urls))
+
+        return [
+            {
+                'url': img_url,
+                'description': description,
+                'caption': img.alt
+            }
+            for img, img_url, description in zip(images, urls, descriptions)
+            if description is not None
+        ]
+
+    def _transcribe_audio(self, audio_url):
+        """Download one audio file and transcribe it, or return None on failure"""
+        try:
+            # Download (or revalidate) the audio
+            download = self.http_cache.fetch(audio_url)
+
+            cache_file, transcription = self._cached_result("audio", download)
+            if transcription is not None:
+                return transcription
+
+            # Transcribe using Whisper, uploading straight from the cached file
+            with open(download.path, 'rb') as audio_file:
                 model = self.client.audio.transcriptions.create(
                     model="whisper-1",
-                    file=audio_data
+                    file=(os.path.basename(audio_url), audio_file)
                 )
-                transcription = model.text
-                
-                # Cache the transcription
-                with open(cache_file, 'w') as f:
-                    f.write(transcription)
+            transcription = model.text
             
-            audio_transcriptions.append({
+            # Cache the transcription
+            with open(cache_file, 'w') as f:
+                f.write(transcription)
+            return transcription
+
+        except requests.exceptions.RequestException as e:
+            print(f"Error downloading audio from {audio_url}: {str(e)}")
+        except Exception as e:
+            print(f"Error processing audio from {audio_url}: {str(e)}")
+        return None
+        
+    def process_audio(self, document):
+        """Process audio files in the article"""
+        urls = [audio.url for audio in document.audio()]
+
+        with ThreadPoolExecutor(max_workers=self.audio_workers) as executor:
+            transcriptions = list(executor.map(self._transcribe_audio, urls))
+
+        return [
+            {
                 'url': audio_url,
                 'transcription': transcription
-            })
-            
-        return audio_transcriptions
+            }
+            for audio_url, transcription in zip(urls, transcriptions)
+            if transcription is not None
+        ]
+
+    def process_media(self, document):
+        """Process images and audio at the same time, each under its own worker limit"""
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            images = executor.submit(self.process_images, document)
+            audio = executor.submit(self.process_audio, document)
+            return images.result(), audio.result()
         
     def get_questions(self):
         """Fetch questions from the API"""
-        response = requests.get(self.questions_url)
-        return response.text
+        return self.http_cache.fetch(self.questions_url).read_text()
         
-    def answer_questions(self, article_content, image_descriptions, audio_transcriptions, questions):
-        """Generate answers to the questions using the processed content"""
-        # Parse questions into a list
-        question_list = [q.strip() for q in questions.split('\n') if q.strip()]
-        answers = {}
-        
-        for i, question in enumerate(question_list, 1):
-            question_id = f"{i:02d}"  # Format as "01", "02", etc.
-            
-            # Add specific guidance for question 3
-            additional_guidance = ""
-            if question_id == "03":
-                additional_guidance = "\nNote: The answer is NOT Batman and samego siebie sprzed dwóch lat. Please look carefully at the context for the correct answer."
-            
-            # Create context for this specific question
-            context = f"""
+    SYSTEM_PROMPT = "You are a precise assistant that provides concise but complete sentence answers. Focus on essential information while maintaining proper sentence structure. Never exceed 15 words in your answer."
+
+    def _guidance(self, question_id):
+        # Add specific guidance for question 3
+        if question_id == "03":
+            return "\nNote: The answer is NOT Batman and samego siebie sprzed dwóch lat. Please look carefully at the context for the correct answer."
+        return ""
+
+    def _shared_context(self, article_content, image_descriptions, audio_transcriptions):
+        return f"""
             Article Content:
             {article_content}
             
@@ -178,41 +212,216 @@ class ArxivTask:
             
             Audio Transcriptions:
             {json.dumps(audio_transcriptions, indent=2)}
-            
+            """
+
+    def _clean_answer(self, answer_text):
+        # Remove any quotes if present
+        answer_text = answer_text.strip().strip('"\'')
+        
+        # Ensure the answer is a complete sentence
+        if answer_text and not answer_text.endswith(('.', '!', '?')):
+            answer_text += '.'
+        return answer_text
+
+    def _is_usable(self, answer_text):
+        return bool(answer_text) and len(answer_text.split()) <= 15
+
+    def _answer_single(self, question_id, question, shared_context):
+        # Create context for this specific question
+        context = f"""{shared_context}
             Question {question_id}:
-            {question}{additional_guidance}
+            {question}{self._guidance(question_id)}
             
             Provide a single, very concise answer (maximum 10 words) that captures only the most essential information.
             The answer should be in the format: "answer text"
             """
-            
-            response = self.client.chat.completions.create(
-                model="o3",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a precise assistant that provides concise but complete sentence answers. Focus on essential information while maintaining proper sentence structure. Never exceed 15 words in your answer."
-                    },
-                    {
-                        "role": "user",
-                        "content": context
+        
+        response = self.client.chat.completions.create(
+            model="o3",
+            messages=[
+                {
+                    "role": "system",
+                    "content": self.SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": context
+                }
+            ]
+        )
+        return self._clean_answer(response.choices[0].message.content), response.usage
+
+    def _answer_batch(self, question_ids, question_list, shared_context):
+        questions_block = "\n".join(
+            f"Question {question_id}:\n{question}{self._guidance(question_id)}\n"
+            for question_id, question in zip(question_ids, question_list)
+        )
+        context = f"""{shared_context}
+            {questions_block}
+            For every question provide a single, very concise answer (maximum 10 words) that captures only the most essential information.
+            Return a JSON object mapping each question id to its answer text.
+            """
+        response = self.client.chat.completions.create(
+            model="o3",
+            messages=[
+                {
+                    "role": "system",
+                    "content": self.SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": context
+                }
+            ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "answers",
+                    "strict": True,
+                    "schema": {
+                        "type": "object",
+                        "properties": {question_id: {"type": "string"} for question_id in question_ids},
+                        "required": question_ids,
+                        "additionalProperties": False
                     }
-                ]
-            )
-            
-            # Extract the answer
-            answer_text = response.choices[0].message.content.strip()
-            # Remove any quotes if present
-            answer_text = answer_text.strip('"\'')
-            
-            # Ensure the answer is a complete sentence
-            if not answer_text.endswith(('.', '!', '?')):
-                answer_text += '.'
-            
+                }
+            }
+        )
+        try:
+            raw_answers = json.loads(response.choices[0].message.content)
+        except (json.JSONDecodeError, TypeError):
+            print("Batched answer was not valid JSON; falling back to single questions")
+            raw_answers = {}
+        return {question_id: self._clean_answer(str(raw_answers.get(question_id, ""))) for question_id in question_ids}, response.usage
+
+    def chunk_article(self, document, image_descriptions, audio_transcriptions):
+        """Split the article into paragraph chunks, with image and audio chunks where they appear"""
+        descriptions = {d['url']: d for d in image_descriptions}
+        transcriptions = {a['url']: a for a in audio_transcriptions}
+        chunks = []
+        for element in document.elements():
+            kind = getattr(element, 'kind', 'text')
+            if kind == 'image':
+                media = descriptions.get(element.url)
+                if not media:
+                    continue
+                text = f"Image ({media['caption']}): {media['description']}"
+            elif kind == 'audio':
+                media = transcriptions.get(element.url)
+                if not media:
+                    continue
+                text = f"Audio transcription: {media['transcription']}"
+            else:
+                # Headings only name the section of the chunks that follow
+                if element.tag in HEADING_TAGS or not element.text:
+                    continue
+                text = element.text
+            chunks.append({'id': len(chunks), 'section': element.section, 'kind': kind, 'text': text})
+        return chunks
+
+    def _embed(self, texts):
+        """Embeddings for texts, cached on disk by content hash"""
+        cache_file = os.path.join(self.cache_dir, "embeddings.json")
+        cache = {}
+        if os.path.exists(cache_file):
+            with open(cache_file, 'r') as f:
+                cache = json.load(f)
+        keys = [hashlib.sha256(text.encode()).hexdigest() for text in texts]
+        missing = [(key, text) for key, text in zip(keys, texts) if key not in cache]
+        if missing:
+            response = self.client.embeddings.create(model="text-embedding-3-small", input=[text for _, text in missing])
+            for (key, _), item in zip(missing, response.data):
+                cache[key] = item.embedding
+            with open(cache_file, 'w') as f:
+                json.dump(cache, f)
+        vectors = np.array([cache[key] for key in keys], dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _retrieve(self, question, chunks, index, chunk_vectors, top_k, token_budget, encoding):
+        scores = index.scores(question)
+        if chunk_vectors is not None:
+            # Equal-weight blend of max-normalised BM25 and cosine similarity
+            similarity = chunk_vectors @ self._embed([question])[0]
+            scores = 0.5 * scores / max(scores.max(), 1e-9) + 0.5 * np.clip(similarity, 0, None)
+        passages = [chunk['text'] for chunk in chunks]
+        if not (scores > 0).any():
+            # Nothing matches the question at all; rather than an empty context it gets
+            # the article from the top, as much of it as fits the budget
+            print(f"No chunk matches {question!r}; falling back to the article in order")
+            return pack_passages(passages, np.ones(len(passages)), token_budget, lambda text: len(encoding.encode(text)))
+        top = np.zeros_like(scores)
+        best = np.argsort(-scores, kind="stable")[:top_k]
+        top[best] = scores[best]
+        return pack_passages(passages, top, token_budget, lambda text: len(encoding.encode(text)))
+
+    def _chunk_context(self, chunks, chunk_ids):
+        excerpts = "\n\n".join(
+            f"[{chunks[i]['section'] or 'Article'}] {chunks[i]['text']}" for i in sorted(chunk_ids)
+        )
+        return f"""
+            Article Excerpts:
+            {excerpts}
+            """
+
+    def answer_questions(self, article_content, image_descriptions, audio_transcriptions, questions, batched=True,
+                         chunks=None, top_k=6, token_budget=3000, use_embeddings=False):
+        """Generate answers to the questions using the processed content
+
+        With batched=True the shared context is sent once together with every
+        question; answers that come back empty or too long are asked again one
+        question at a time. batched=False asks each question separately.
+
+        When chunks (from chunk_article) are given, each question only gets its
+        top_k best matching chunks within token_budget instead of the whole
+        article; a batched request gets the union of those chunks.
+        """
+        # Parse questions into a list
+        question_list = [q.strip() for q in questions.split('\n') if q.strip()]
+        question_ids = [f"{i:02d}" for i in range(1, len(question_list) + 1)]  # Format as "01", "02", etc.
+        if chunks:
+            index = BM25Index([f"{chunk['section']}\n{chunk['text']}" for chunk in chunks])
+            chunk_vectors = self._embed([chunk['text'] for chunk in chunks]) if use_embeddings else None
+            encoding = tiktoken.encoding_for_model("o3")
+            contexts = {}
+            used_chunks = set()
+            for question_id, question in zip(question_ids, question_list):
+                selected = self._retrieve(question, chunks, index, chunk_vectors, top_k, token_budget, encoding)
+                print(f"Question {question_id} backed by chunks:")
+                for i, score in selected:
+                    print(f"  #{i} [{score:.2f}] {chunks[i]['kind']} / {chunks[i]['section'] or 'Article'}: {chunks[i]['text'][:80]}")
+                contexts[question_id] = self._chunk_context(chunks, [i for i, _ in selected])
+                used_chunks.update(i for i, _ in selected)
+            shared_context = self._chunk_context(chunks, used_chunks)
+        else:
+            shared_context = self._shared_context(article_content, image_descriptions, audio_transcriptions)
+            contexts = {question_id: shared_context for question_id in question_ids}
+        answers = {}
+        prompt_tokens = 0
+
+        if batched and question_list:
+            answers, usage = self._answer_batch(question_ids, question_list, shared_context)
+            batch_prompt_tokens = usage.prompt_tokens if usage else 0
+            prompt_tokens += batch_prompt_tokens
+            for question_id, answer_text in answers.items():
+                print(f"Processed question {question_id}: {answer_text}")
+
+        for question_id, question in zip(question_ids, question_list):
+            if self._is_usable(answers.get(question_id, "")):
+                continue
+            if batched:
+                print(f"Retrying question {question_id} on its own")
+            answer_text, usage = self._answer_single(question_id, question, contexts[question_id])
+            prompt_tokens += usage.prompt_tokens if usage else 0
             answers[question_id] = answer_text
             print(f"Processed question {question_id}: {answer_text}")
+
+        if batched and question_list and batch_prompt_tokens:
+            # Asking one by one resends roughly the whole batch prompt per question
+            estimated_single = batch_prompt_tokens * len(question_list)
+            print(f"Prompt tokens: {prompt_tokens} used, ~{estimated_single - prompt_tokens} saved "
+                  f"versus ~{estimated_single} for {len(question_list)} separate requests")
             
-        return answers
+        return dict(sorted(answers.items()))
         
     def submit_answers(self, answers):
         """Submit answers to the API"""
@@ -226,7 +435,7 @@ class ArxivTask:
         
         try:
             print(payload)
-            response = requests.post(f"{self.base_url}/report", json=payload)
+            response = self.session.post(f"{self.base_url}/report", json=payload)
             response.raise_for_status()  # Raise an exception for bad status codes
             
             # Print the raw response for debugging
@@ -256,21 +465,28 @@ def main():
     task = ArxivTask()
     
     # Get and process article content
-    soup = task.get_article_content()
+    document = task.get_article_content()
     
     # Process images and audio
-    image_descriptions = task.process_images(soup)
-    audio_transcriptions = task.process_audio(soup)
+    image_descriptions, audio_transcriptions = task.process_media(document)
     
     # Get questions
     questions = task.get_questions()
     
-    # Generate answers
+    # RETRIEVAL=1 gives each question only its best matching chunks of the article
+    chunks = None
+    if os.getenv("RETRIEVAL") == "1":
+        chunks = task.chunk_article(document, image_descriptions, audio_transcriptions)
+
+    # Generate answers; BATCHED_ANSWERS=0 asks every question in its own request
     answers = task.answer_questions(
-        soup.get_text(),
+        document.text,
         image_descriptions,
         audio_transcriptions,
-        questions
+        questions,
+        batched=os.getenv("BATCHED_ANSWERS", "1") != "0",
+        chunks=chunks,
+        use_embeddings=os.getenv("RETRIEVAL_EMBEDDINGS") == "1"
     )
     
     # Submit answers
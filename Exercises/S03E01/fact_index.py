@@ -0,0 +1,121 @@
+"""Links reports to the fact files that talk about the same people or sectors.
+
+Names are matched on a stemmed surname through a BK-tree, so inflected forms
+("Andrzejem Majem") and typos ("Ragowski"/"Ragorski", "Kowaski"/"Kowalki") still
+find each other.
+"""
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+UPPER = "A-ZĄĆĘŁŃÓŚŹŻ"
+LOWER = "a-ząćęłńóśźż"
+NAME_RE = re.compile(rf"(?<![{UPPER}{LOWER}])([{UPPER}][{LOWER}]+)\s+([{UPPER}][{LOWER}]{{2,}})(?![{LOWER}])")
+# The letter stays case-sensitive so "sektor a" (Polish "and") is not read as sector A
+SECTOR_RE = re.compile(rf"(?i:sektor)[{LOWER}]*[\s_-]+([A-D])(?![{LOWER}])")
+
+# Polish case endings, longest first, stripped so "Ragowskiego" and "Ragowski" share a stem
+CASE_ENDINGS = ("iego", "owie", "iej", "emu", "ego", "owi", "em", "ie", "im", "ą", "ę", "a", "y", "i", "u")
+
+
+def stem(word: str) -> str:
+    word = word.lower()
+    for ending in CASE_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def levenshtein(a: str, b: str) -> int:
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def typo_tolerance(word: str) -> int:
+    return 1 if len(word) <= 5 else 2
+
+
+class BKTree:
+    """Burkhard-Keller tree over words, for "everything within distance d" lookups."""
+
+    def __init__(self):
+        self.root: Optional[Tuple[str, Dict[int, tuple]]] = None
+
+    def add(self, word: str):
+        if self.root is None:
+            self.root = (word, {})
+            return
+        node = self.root
+        while True:
+            distance = levenshtein(word, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (word, {})
+                return
+            node = child
+
+    def search(self, word: str, max_distance: int) -> List[Tuple[str, int]]:
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node_word, children = stack.pop()
+            distance = levenshtein(word, node_word)
+            if distance <= max_distance:
+                found.append((node_word, distance))
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+
+def extract_people(text: str) -> Set[Tuple[str, str]]:
+    return set(NAME_RE.findall(text))
+
+
+def extract_sectors(text: str) -> Set[str]:
+    return set(SECTOR_RE.findall(text))
+
+
+class FactIndex:
+    """Built once per run from every fact file, then queried for each report."""
+
+    def __init__(self, facts: Dict[str, str]):
+        self.facts = facts
+        self.surnames = BKTree()
+        # surname stem -> [(fact file, first name, full name as written in the fact)]
+        self.people: Dict[str, List[Tuple[str, str, str]]] = {}
+        self.sectors: Dict[str, List[str]] = {}
+        for fact_name, content in facts.items():
+            for first, last in extract_people(content):
+                surname = stem(last)
+                self.surnames.add(surname)
+                self.people.setdefault(surname, []).append((fact_name, first, f"{first} {last}"))
+            for sector in extract_sectors(content):
+                self.sectors.setdefault(sector, []).append(fact_name)
+
+    def link(self, report_filename: str, report_content: str) -> Dict[str, List[str]]:
+        """Return the facts relevant to a report, each with the reasons it was attached."""
+        reasons: Dict[str, List[str]] = {}
+        text = f"{report_filename}\n{report_content}"
+
+        for first, last in extract_people(report_content):
+            surname = stem(last)
+            for match, distance in self.surnames.search(surname, typo_tolerance(surname)):
+                for fact_name, fact_first, fact_full_name in self.people[match]:
+                    if fact_first[0].lower() != first[0].lower():
+                        continue
+                    reasons.setdefault(fact_name, []).append(
+                        f"person '{first} {last}' ~ '{fact_full_name}' (distance {distance})"
+                    )
+
+        for sector in extract_sectors(text):
+            for fact_name in self.sectors.get(sector, []):
+                reasons.setdefault(fact_name, []).append(f"sector {sector}")
+
+        return {fact_name: sorted(set(why)) for fact_name, why in sorted(reasons.items())}
@@ -1,9 +1,16 @@
 import os
 import json
+import hashlib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import requests
-from openai import OpenAI
 import dotenv
+from fact_index import FactIndex
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from common.llm_client import get_client
 
 dotenv.load_dotenv(dotenv_path="../../.env")
 
@@ -30,6 +37,9 @@ def get_all_facts(facts_dir):
     return facts
 
 def prepare_llm_prompt(report_content, report_filename, facts):
+    # Everything up to and including the facts is identical for every report that
+    # links the same facts, so the provider can serve it from its prefix cache;
+    # only the report itself goes at the end
     prompt = f"""Przeanalizuj poniższy raport i wygeneruj precyzyjną listę słów kluczowych w języku polskim.
 
 WAŻNE WSKAZÓWKI:
@@ -53,29 +63,118 @@ WAŻNE WSKAZÓWKI:
    - Uwzględnij nazwiska i imiona, jeśli są istotne dla raportu
    - Bądź precyzyjny - każde słowo kluczowe powinno mieć konkretne uzasadnienie w raporcie lub faktach
 
-Nazwa pliku raportu: {report_filename}
-Treść raportu:
-{report_content}
+Format odpowiedzi: lista,słów,kluczowych,oddzielonych,przecinkami
 
 Dodatkowe fakty do analizy:
-{json.dumps(facts, indent=2, ensure_ascii=False)}
+{json.dumps(facts, indent=2, ensure_ascii=False, sort_keys=True)}
 
-Format odpowiedzi: lista,słów,kluczowych,oddzielonych,przecinkami"""
+Nazwa pliku raportu: {report_filename}
+Treść raportu:
+{report_content}"""
     return prompt
 
-def process_reports(reports_dir, facts_dir, openai_api_key):
-    client = OpenAI(api_key=openai_api_key)
+SYSTEM_PROMPT = "Jesteś precyzyjnym asystentem analizującym raporty i generującym słowa kluczowe w języku polskim. Twoje słowa kluczowe muszą być dokładne, konkretne i uwzględniać wszystkie istotne informacje z raportu, faktów oraz nazwy pliku."
+
+MODEL_PARAMS = {"model": "gpt-4", "temperature": 0.3}
+
+# Responses memoized by the hash of the full request
+RESPONSE_CACHE_DIR = Path(__file__).resolve().parent / "cache" / "responses"
+
+def sha256_text(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def template_hash():
+    # Rendering the template with empty inputs captures every fixed part of the prompt
+    return sha256_text(SYSTEM_PROMPT + prepare_llm_prompt("", "", {}))
+
+def report_inputs(report_content, report_facts):
+    """Hashes of everything that decides a report's keywords."""
+    return {
+        "report": sha256_text(report_content),
+        "facts": {fact_name: sha256_text(content) for fact_name, content in sorted(report_facts.items())},
+        "template": template_hash(),
+        "params": sha256_text(json.dumps(MODEL_PARAMS, sort_keys=True))
+    }
+
+def changed_inputs(previous, current):
+    if previous is None:
+        return ["new report"]
+    reasons = [key for key in ("report", "template", "params") if previous.get(key) != current[key]]
+    old_facts, new_facts = previous.get("facts", {}), current["facts"]
+    for fact_name in sorted(set(old_facts) | set(new_facts)):
+        if old_facts.get(fact_name) != new_facts.get(fact_name):
+            reasons.append(f"fact {fact_name}")
+    return reasons
+
+def load_previous_run(keywords_path):
+    """Keywords and input hashes saved by the last run, or empty dicts."""
+    inputs_path = Path(keywords_path).with_suffix('.inputs.json')
+    if not (os.path.exists(keywords_path) and inputs_path.exists()):
+        return {}, {}
+    with open(keywords_path, 'r', encoding='utf-8') as f:
+        keywords = json.load(f)
+    with open(inputs_path, 'r', encoding='utf-8') as f:
+        inputs = json.load(f)
+    return keywords, inputs
+
+def save_run(keywords_path, results, inputs):
+    with open(keywords_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    with open(Path(keywords_path).with_suffix('.inputs.json'), 'w', encoding='utf-8') as f:
+        json.dump(inputs, f, indent=2, sort_keys=True)
+
+def generate_keywords(client, prompt):
+    """Return (keywords, latency, usage); usage is None when the answer came from the local memo."""
+    request = {
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        **MODEL_PARAMS
+    }
+    memo_file = RESPONSE_CACHE_DIR / f"{sha256_text(json.dumps(request, sort_keys=True, ensure_ascii=False))}.json"
+    if memo_file.exists():
+        with open(memo_file, 'r', encoding='utf-8') as f:
+            return json.load(f)["keywords"], 0.0, None
+
+    started = time.perf_counter()
+    response = client.chat.completions.create(**request)
+    latency = time.perf_counter() - started
+    keywords = response.choices[0].message.content.strip()
+
+    RESPONSE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(memo_file, 'w', encoding='utf-8') as f:
+        json.dump({"keywords": keywords, "usage": response.usage.model_dump() if response.usage else None}, f, ensure_ascii=False)
+    return keywords, latency, response.usage
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+def process_reports(reports_dir, facts_dir, openai_api_key, max_workers=4, previous_results=None, previous_inputs=None):
+    """Return (keywords, input hashes) per report.
+
+    Reports whose hashes match previous_inputs reuse previous_results instead
+    of calling the model; pass neither to regenerate everything.
+    """
+    # Shared client: rate limits and logged retries with backoff live in common.llm_client
+    client = get_client(api_key=openai_api_key)
     facts = get_all_facts(facts_dir)
+    fact_index = FactIndex(facts)
+    previous_results = previous_results or {}
+    previous_inputs = previous_inputs or {}
     results = {}
+    inputs = {}
     
     print(f"Looking for reports in: {reports_dir}")
     if not os.path.exists(reports_dir):
         print(f"Reports directory does not exist: {reports_dir}")
-        return results
+        return results, inputs
     
-    report_files = list(Path(reports_dir).glob('*sektor_*.txt'))
+    report_files = sorted(Path(reports_dir).glob('*sektor_*.txt'))
     print(f"Found {len(report_files)} report files")
     
+    prompts = {}
     for report_file in report_files:
         print(f"Processing report: {report_file}")
         report_content = read_file_content(report_file)
@@ -83,33 +182,76 @@ def process_reports(reports_dir, facts_dir, openai_api_key):
             print(f"Skipping {report_file} due to read error")
             continue
             
-        prompt = prepare_llm_prompt(report_content, report_file.name, facts)
-        
-        try:
-            # Call OpenAI API
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "Jesteś precyzyjnym asystentem analizującym raporty i generującym słowa kluczowe w języku polskim. Twoje słowa kluczowe muszą być dokładne, konkretne i uwzględniać wszystkie istotne informacje z raportu, faktów oraz nazwy pliku."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3
-            )
-            
-            keywords = response.choices[0].message.content.strip()
-            results[report_file.name] = keywords
-            print(f"Successfully processed {report_file.name}")
+        linked = fact_index.link(report_file.name, report_content)
+        for fact_name, reasons in linked.items():
+            print(f"  attaching {fact_name}: {'; '.join(reasons)}")
+        report_facts = {fact_name: facts[fact_name] for fact_name in linked}
+        current = report_inputs(report_content, report_facts)
+        reasons = changed_inputs(previous_inputs.get(report_file.name), current)
+        if not reasons and report_file.name in previous_results:
+            print("  unchanged, reusing previous keywords")
+            results[report_file.name] = previous_results[report_file.name]
+            inputs[report_file.name] = current
+            continue
+        print(f"  regenerating: {', '.join(reasons) or 'no previous keywords'}")
+        prompts[report_file.name] = prepare_llm_prompt(report_content, report_file.name, report_facts)
+        inputs[report_file.name] = current
+
+    latencies = {}
+    prompt_tokens = 0
+    cached_prompt_tokens = 0
+    completion_tokens = 0
+    memo_hits = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(generate_keywords, client, prompt): report_name
+            for report_name, prompt in prompts.items()
+        }
+        for future in as_completed(futures):
+            report_name = futures[future]
+            try:
+                keywords, latency, usage = future.result()
+            except Exception as e:
+                print(f"Error processing {report_name}: {str(e)}")
+                # Not recorded, so the next run tries this report again
+                inputs.pop(report_name)
+                continue
+            results[report_name] = keywords
+            if usage is None:
+                memo_hits += 1
+                print(f"Loaded {report_name} from the response memo")
+                print(f"Generated keywords: {keywords}")
+                continue
+            latencies[report_name] = latency
+            prompt_tokens += usage.prompt_tokens
+            completion_tokens += usage.completion_tokens
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached_prompt_tokens += (getattr(details, "cached_tokens", None) or 0) if details else 0
+            print(f"Successfully processed {report_name} in {latency:.2f}s")
             print(f"Generated keywords: {keywords}")
-            
-        except Exception as e:
-            print(f"Error processing {report_file.name}: {str(e)}")
-    
-    return results
+    elapsed = time.perf_counter() - started
+
+    if latencies:
+        print(f"\n{len(latencies)}/{len(prompts)} reports in {elapsed:.2f}s with {max_workers} workers: "
+              f"p50 {percentile(latencies.values(), 50):.2f}s, p95 {percentile(latencies.values(), 95):.2f}s, "
+              f"{prompt_tokens} prompt + {completion_tokens} completion tokens")
+        print(f"Prompt tokens: {cached_prompt_tokens} served from the provider prefix cache, "
+              f"{prompt_tokens - cached_prompt_tokens} uncached")
+    if memo_hits:
+        print(f"{memo_hits} reports answered from the local response memo")
+
+    # Same order every run regardless of which call finished first
+    return dict(sorted(results.items())), inputs
 
 def main():
     # Configuration
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     DV_API_KEY = os.getenv('DV_API_KEY')
+    MAX_WORKERS = int(os.getenv('MAX_WORKERS', '4'))
+    # FULL_RUN=1 ignores the saved input hashes and queries every report again
+    FULL_RUN = os.getenv('FULL_RUN') == '1'
+    KEYWORDS_PATH = 'keywords.json'
     
     if not OPENAI_API_KEY:
         raise ValueError("OPENAI_API_KEY environment variable is required")
@@ -126,14 +268,19 @@ def main():
     print(f"Facts directory: {FACTS_DIR}")
     
     # Process reports
-    results = process_reports(REPORTS_DIR, FACTS_DIR, OPENAI_API_KEY)
+    previous_results, previous_inputs = ({}, {}) if FULL_RUN else load_previous_run(KEYWORDS_PATH)
+    results, inputs = process_reports(
+        REPORTS_DIR, FACTS_DIR, OPENAI_API_KEY,
+        max_workers=MAX_WORKERS,
+        previous_results=previous_results,
+        previous_inputs=previous_inputs
+    )
     
     print("\nFinal results:")
     print(json.dumps(results, indent=2, ensure_ascii=False))
     
     # Save results
-    with open('keywords.json', 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    save_run(KEYWORDS_PATH, results, inputs)
     
     # Prepare payload for central API
     
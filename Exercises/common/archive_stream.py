@@ -0,0 +1,140 @@
+"""Stream zip members to disk one at a time, with zip-bomb limits and nested archives.
+
+Members are read through ZipFile.open in fixed-size blocks, hashed as they are
+written and checked against per-member, total and compression-ratio caps, so memory
+use stays at one block whatever the archive holds. Identical members are written
+once. Members that are zips themselves are opened in turn, up to max_depth.
+"""
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterator, Optional
+import hashlib
+import os
+import tempfile
+import zipfile
+import zlib
+
+READ_BLOCK_BYTES = 1024 * 1024
+
+
+class ArchiveLimitError(Exception):
+    """Raised when an archive as a whole goes over the extraction limits."""
+
+
+@dataclass
+class ExtractionLimits:
+    max_member_bytes: int = 100 * 1024 * 1024
+    max_total_bytes: int = 500 * 1024 * 1024
+    max_members: int = 10000
+    # Uncompressed / compressed size, only checked once a member passes ratio_floor_bytes
+    max_ratio: float = 100.0
+    ratio_floor_bytes: int = 1024 * 1024
+    max_depth: int = 3
+
+
+@dataclass
+class ExtractedMember:
+    # Archive chain and member name, e.g. "outer.zip!inner.zip!report.txt"
+    source: str
+    name: str
+    path: Path
+    sha256: str
+    size: int
+    # True when an identical member was already extracted; path points at that copy
+    duplicate: bool = False
+
+
+def _safe_relative_path(name: str) -> Path:
+    # Member names are untrusted; drop absolute roots, drive letters and ".." parts
+    parts = [part for part in PurePosixPath(name.replace("\\", "/")).parts
+             if part not in ("", ".", "..", "/") and not part.endswith(":")]
+    return Path(*parts) if parts else Path("unnamed")
+
+
+class StreamingExtractor:
+    def __init__(self, output_dir: Path, limits: Optional[ExtractionLimits] = None,
+                 password: Optional[bytes] = None):
+        self.output_dir = Path(output_dir)
+        self.limits = limits or ExtractionLimits()
+        self.password = password
+        self.total_bytes = 0
+        self.members = 0
+        # sha256 -> first extracted copy
+        self.seen: Dict[str, Path] = {}
+
+    def extract(self, archive_path: Path) -> Iterator[ExtractedMember]:
+        """Yield every file member of archive_path (and of archives inside it) once it is on disk"""
+        archive_path = Path(archive_path)
+        yield from self._extract(archive_path, archive_path.name, self.output_dir / archive_path.stem, 0)
+
+    def _extract(self, archive_path: Path, source: str, target_dir: Path, depth: int) -> Iterator[ExtractedMember]:
+        encrypted = 0
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                self.members += 1
+                if self.members > self.limits.max_members:
+                    raise ArchiveLimitError(f"{source}: more than {self.limits.max_members} members")
+                member_source = f"{source}!{info.filename}"
+                if info.flag_bits & 0x1 and self.password is None:
+                    encrypted += 1
+                    continue
+                if info.file_size > self.limits.max_member_bytes:
+                    print(f"Skipping {member_source}: declares {info.file_size} bytes, "
+                          f"over the {self.limits.max_member_bytes} byte member limit")
+                    continue
+
+                member = self._write_member(archive, info, member_source, target_dir)
+                if member is None:
+                    continue
+                yield member
+
+                if (not member.duplicate and depth < self.limits.max_depth
+                        and zipfile.is_zipfile(member.path)):
+                    nested_dir = member.path.with_name(member.path.stem)
+                    yield from self._extract(member.path, member_source, nested_dir, depth + 1)
+        if encrypted:
+            print(f"Skipped {encrypted} encrypted members of {source} (no password given)")
+
+    def _write_member(self, archive: zipfile.ZipFile, info: zipfile.ZipInfo, source: str,
+                      target_dir: Path) -> Optional[ExtractedMember]:
+        limits = self.limits
+        target_dir.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=target_dir, suffix=".part")
+        try:
+            # Declared sizes can lie, so the limits are enforced on the bytes actually read
+            with os.fdopen(fd, 'wb') as out, archive.open(info, pwd=self.password) as member:
+                for block in iter(lambda: member.read(READ_BLOCK_BYTES), b""):
+                    size += len(block)
+                    if size > limits.max_member_bytes:
+                        print(f"Skipping {source}: over the {limits.max_member_bytes} byte member limit")
+                        return None
+                    if size > limits.ratio_floor_bytes and size > limits.max_ratio * max(info.compress_size, 1):
+                        print(f"Skipping {source}: compression ratio over {limits.max_ratio:g}")
+                        return None
+                    if self.total_bytes + size > limits.max_total_bytes:
+                        raise ArchiveLimitError(f"{source}: archives expand past {limits.max_total_bytes} bytes")
+                    digest.update(block)
+                    out.write(block)
+            self.total_bytes += size
+            sha256 = digest.hexdigest()
+
+            first_copy = self.seen.get(sha256)
+            if first_copy is not None:
+                return ExtractedMember(source, info.filename, first_copy, sha256, size, duplicate=True)
+
+            path = target_dir / _safe_relative_path(info.filename)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, path)
+            self.seen[sha256] = path
+            return ExtractedMember(source, info.filename, path, sha256, size)
+        except (RuntimeError, zipfile.BadZipFile, zlib.error) as e:
+            # A wrong password shows up as RuntimeError, or as a CRC or inflate error
+            print(f"Skipping {source}: {e}")
+            return None
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
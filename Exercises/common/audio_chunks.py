@@ -0,0 +1,172 @@
+"""Split long recordings at silences with ffmpeg, transcribe the pieces in parallel and stitch them back."""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable
+import re
+import subprocess
+import tempfile
+
+from .hashing import file_sha256
+
+# Whisper rejects uploads above 25 MB
+WHISPER_MAX_BYTES = 25 * 1024 * 1024
+
+_SILENCE_RE = re.compile(r"silence_(start|end): (-?\d+(?:\.\d+)?)")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def probe_duration(path: Path) -> float:
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", str(path)],
+        capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip())
+
+
+def detect_silences(path: Path, noise_db: int = -35, min_silence: float = 0.5) -> list[float]:
+    """Return the midpoint (in seconds) of every silent stretch ffmpeg finds."""
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostats", "-i", str(path),
+         "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}", "-f", "null", "-"],
+        capture_output=True, text=True
+    )
+    midpoints = []
+    start = None
+    for kind, value in _SILENCE_RE.findall(result.stderr):
+        if kind == "start":
+            start = float(value)
+        elif start is not None:
+            midpoints.append((start + float(value)) / 2)
+            start = None
+    return midpoints
+
+
+def plan_segments(duration: float, silences: list[float], segment_seconds: float = 600,
+                  overlap_seconds: float = 2.0) -> list[tuple[float, float]]:
+    """Cut at the last silence before each segment_seconds mark.
+
+    A cut in the middle of a silence splits no word, so the segments meet exactly
+    there. Only a hard cut at the mark itself (no silence in the second half of the
+    segment) is padded with overlap on both sides, for stitch() to align.
+    """
+    cuts = []
+    position = 0.0
+    while duration - position > segment_seconds:
+        limit = position + segment_seconds
+        candidates = [s for s in silences if position + segment_seconds / 2 < s <= limit]
+        position = candidates[-1] if candidates else limit
+        cuts.append((position, overlap_seconds if not candidates else 0.0))
+
+    bounds = [(0.0, 0.0)] + cuts + [(duration, 0.0)]
+    return [
+        (max(start - start_pad, 0.0), min(end + end_pad, duration))
+        for (start, start_pad), (end, end_pad) in zip(bounds, bounds[1:])
+    ]
+
+
+def extract_segment(path: Path, start: float, end: float, out_path: Path):
+    # Mono 16 kHz mp3 keeps a 10 minute segment at a few MB
+    subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}",
+         "-i", str(path), "-ac", "1", "-ar", "16000", "-c:a", "libmp3lame", "-b:a", "64k", str(out_path)],
+        check=True
+    )
+
+
+def stitch(texts: list[str], overlapping: list[bool] | None = None, max_overlap_words: int = 40,
+           min_match_words: int = 2) -> str:
+    """Join segment transcripts, dropping the words an overlap made both sides transcribe.
+
+    overlapping[i] says whether texts[i] and texts[i + 1] share audio (all joins do
+    when it is None); other joins are simply concatenated. At an overlapping join the
+    last word of the text so far may be clipped (it ends at the cut), and so may the
+    first word of the next text, so neither has to match: the longest run of at least
+    min_match_words words before the last word that reappears at the start of the next
+    text marks the overlap, and the next text's own copy of the clipped word is kept.
+    Without such a run both sides are kept whole rather than risk dropping real words.
+    """
+    merged: list[str] = []
+    for index, text in enumerate(texts):
+        words = text.split()
+        if merged and (overlapping is None or overlapping[index - 1]):
+            tail = [w.lower() for w in _normalized(merged[-max_overlap_words - 1:-1])]
+            head = [w.lower() for w in _normalized(words[:max_overlap_words])]
+            for size in range(min(len(tail), len(head)), min_match_words - 1, -1):
+                offset = next((offset for offset in (0, 1) if tail[-size:] == head[offset:offset + size]), None)
+                if offset is not None:
+                    del merged[-1]
+                    words = words[offset + size:]
+                    break
+        merged.extend(words)
+    return " ".join(merged)
+
+
+def _normalized(words: list[str]) -> list[str]:
+    return ["".join(_WORD_RE.findall(word)) for word in words]
+
+
+class ChunkedTranscriber:
+    """Transcribe a recording segment by segment, caching each segment's text.
+
+    A segment that fails is left out of the cache, so calling transcribe() again
+    only sends the segments that are still missing. Up to max_workers segments are
+    cut and sent at once; when the caller runs several files concurrently,
+    transcribe_fn has to take the caller's own upload slots so the total stays
+    within its limit.
+    """
+
+    def __init__(self, transcribe_fn: Callable[[Path], str], cache_dir: str | Path, max_workers: int = 4,
+                 segment_seconds: float = 600, overlap_seconds: float = 2.0):
+        self.transcribe_fn = transcribe_fn
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers
+        self.segment_seconds = segment_seconds
+        self.overlap_seconds = overlap_seconds
+
+    def transcribe(self, path: Path, cache_key: str | None = None) -> str:
+        cache_key = cache_key or file_sha256(path)
+        duration = probe_duration(path)
+        if duration <= self.segment_seconds and path.stat().st_size <= WHISPER_MAX_BYTES:
+            segments = [(0.0, duration)]
+        else:
+            segments = plan_segments(duration, detect_silences(path), self.segment_seconds, self.overlap_seconds)
+        print(f"Transcribing {path.name} in {len(segments)} segment(s)")
+
+        texts: list[str | None] = [None] * len(segments)
+        errors = []
+        with tempfile.TemporaryDirectory() as tmp_dir, ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._transcribe_segment, path, cache_key, start, end, Path(tmp_dir), len(segments) == 1): index
+                for index, (start, end) in enumerate(segments)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    texts[index] = future.result()
+                except Exception as e:
+                    start, end = segments[index]
+                    print(f"Error transcribing {path.name} [{start:.1f}s-{end:.1f}s]: {e}")
+                    errors.append(e)
+
+        if errors:
+            raise RuntimeError(f"{len(errors)} of {len(segments)} segments of {path.name} failed; rerun to retry them")
+        overlapping = [end > next_start for (_, end), (next_start, _) in zip(segments, segments[1:])]
+        return stitch(texts, overlapping)
+
+    def _transcribe_segment(self, path: Path, cache_key: str, start: float, end: float, tmp_dir: Path,
+                            whole_file: bool) -> str:
+        cache_file = self.cache_dir / f"{cache_key}-{start:.3f}-{end:.3f}.txt"
+        if cache_file.exists():
+            return cache_file.read_text()
+
+        if whole_file:
+            text = self.transcribe_fn(path)
+        else:
+            segment_path = tmp_dir / f"{start:.3f}-{end:.3f}.mp3"
+            extract_segment(path, start, end, segment_path)
+            text = self.transcribe_fn(segment_path)
+            segment_path.unlink()
+
+        cache_file.write_text(text)
+        return text
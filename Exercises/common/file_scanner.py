@@ -0,0 +1,262 @@
+"""Find files that are not what their extension says: archives hidden in or appended to
+other files, mismatched extensions and data after a format's logical end.
+
+Each file is memory-mapped and every archive signature is searched for in one regex
+pass. Directories are scanned on a process pool, and results are cached by size and
+mtime so unchanged files are not read again.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+import json
+import mmap
+import os
+import re
+import struct
+import zipfile
+
+# Formats recognised at the start of a file: (format, magic bytes)
+HEAD_SIGNATURES = [
+    ("png", b"\x89PNG\r\n\x1a\n"),
+    ("jpeg", b"\xff\xd8\xff"),
+    ("gif", b"GIF87a"),
+    ("gif", b"GIF89a"),
+    ("pdf", b"%PDF-"),
+    ("zip", b"PK\x03\x04"),
+    ("zip", b"PK\x05\x06"),
+    ("rar", b"Rar!\x1a\x07"),
+    ("7z", b"7z\xbc\xaf\x27\x1c"),
+    ("gzip", b"\x1f\x8b\x08"),
+    ("mp3", b"ID3"),
+    ("mp3", b"\xff\xfb"),
+    ("mp3", b"\xff\xf3"),
+    ("mp3", b"\xff\xf2"),
+    ("wav", b"RIFF"),
+    ("elf", b"\x7fELF"),
+    ("exe", b"MZ"),
+]
+
+# Archive signatures searched for anywhere in a file
+ARCHIVE_SIGNATURES = {
+    b"PK\x03\x04": "zip",
+    b"Rar!\x1a\x07": "rar",
+    b"7z\xbc\xaf\x27\x1c": "7z",
+    b"\x1f\x8b\x08": "gzip",
+}
+_ARCHIVE_RE = re.compile(b"|".join(re.escape(magic) for magic in ARCHIVE_SIGNATURES))
+
+EXTENSIONS = {
+    "png": {".png"},
+    "jpeg": {".jpg", ".jpeg"},
+    "gif": {".gif"},
+    "pdf": {".pdf"},
+    "zip": {".zip", ".docx", ".xlsx", ".pptx", ".odt", ".jar"},
+    "rar": {".rar"},
+    "7z": {".7z"},
+    "gzip": {".gz", ".tgz"},
+    "mp3": {".mp3"},
+    "wav": {".wav"},
+    "elf": {"", ".so", ".bin"},
+    "exe": {".exe", ".dll"},
+    "text": {".txt", ".md", ".csv", ".json", ".py", ".html", ".xml", ".log"},
+}
+
+ZIP_METHODS = {0, 8, 9, 12, 14, 93, 95, 98, 99}
+# Padding after a format's end that is not worth reporting
+TRAILING_SLACK_BYTES = 64
+
+
+def detect_format(data) -> Optional[str]:
+    for name, magic in HEAD_SIGNATURES:
+        if data[:len(magic)] == magic:
+            if name == "wav" and data[8:12] != b"WAVE":
+                continue
+            return name
+    sample = data[:4096]
+    if b"\x00" not in sample:
+        try:
+            sample.decode("utf-8")
+            return "text"
+        except UnicodeDecodeError as e:
+            # A multi-byte character cut off at the end of the sample is still text
+            if e.start >= len(sample) - 3:
+                return "text"
+    return None
+
+
+def _png_end(data) -> Optional[int]:
+    position = 8
+    while position + 12 <= len(data):
+        length = struct.unpack(">I", data[position:position + 4])[0]
+        chunk_type = data[position + 4:position + 8]
+        position += 12 + length
+        if chunk_type == b"IEND":
+            return position
+    return None
+
+
+def _jpeg_end(data) -> Optional[int]:
+    size = len(data)
+    position = 2
+    while position + 4 <= size:
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker == 0xD9:
+            return position + 2
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            position += 2
+            continue
+        position += 2 + struct.unpack(">H", data[position + 2:position + 4])[0]
+        if marker == 0xDA:
+            # Entropy-coded data runs until a marker that is not a stuffed 0xFF00 or a restart
+            while True:
+                position = data.find(b"\xff", position)
+                if position < 0 or position + 1 >= size:
+                    return None
+                following = data[position + 1]
+                if following == 0xFF:
+                    position += 1
+                elif following == 0x00 or 0xD0 <= following <= 0xD7:
+                    position += 2
+                else:
+                    break
+    return None
+
+
+def _zip_end(data) -> Optional[int]:
+    eocd = data.rfind(b"PK\x05\x06")
+    if eocd < 0 or eocd + 22 > len(data):
+        return None
+    comment_length = struct.unpack("<H", data[eocd + 20:eocd + 22])[0]
+    return eocd + 22 + comment_length
+
+
+def _pdf_end(data) -> Optional[int]:
+    eof = data.rfind(b"%%EOF")
+    return eof + 5 if eof >= 0 else None
+
+
+FORMAT_END = {"png": _png_end, "jpeg": _jpeg_end, "zip": _zip_end, "pdf": _pdf_end}
+
+
+def _valid_archive_header(data, offset: int, name: str) -> bool:
+    # Short signatures also turn up inside compressed image and audio data
+    if name == "zip":
+        header = data[offset:offset + 30]
+        if len(header) < 30:
+            return False
+        method = struct.unpack("<H", header[8:10])[0]
+        name_length = struct.unpack("<H", header[26:28])[0]
+        return method in ZIP_METHODS and 0 < name_length <= 1024
+    if name == "gzip":
+        header = data[offset:offset + 10]
+        return len(header) == 10 and header[3] & 0xE0 == 0 and (header[9] <= 13 or header[9] == 255)
+    return True
+
+
+def scan_file(path: str) -> Dict:
+    """Scan one file; returns a JSON-serialisable result"""
+    stat = os.stat(path)
+    result = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "format": None,
+        "findings": [],
+        "action": "ok",
+    }
+    if stat.st_size == 0:
+        return result
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        detected = detect_format(data)
+        result["format"] = detected
+        findings = result["findings"]
+
+        extension = os.path.splitext(path)[1].lower()
+        if detected in EXTENSIONS and extension not in EXTENSIONS[detected]:
+            findings.append({"type": "extension_mismatch", "format": detected, "extension": extension})
+
+        end = FORMAT_END[detected](data) if detected in FORMAT_END else None
+        if end is not None and end < len(data):
+            tail = data[end:end + TRAILING_SLACK_BYTES + 1]
+            if len(data) - end > TRAILING_SLACK_BYTES or tail.strip(b"\r\n\t \x00"):
+                findings.append({"type": "trailing_data", "offset": end, "size": len(data) - end})
+
+        # Only the first hit per archive format is reported; inside a zip every member
+        # has its own local header, so zips are only looked for in other formats
+        reported = {detected}
+        for match in _ARCHIVE_RE.finditer(data):
+            offset = match.start()
+            name = ARCHIVE_SIGNATURES[match.group()]
+            if offset == 0 or name in reported or not _valid_archive_header(data, offset, name):
+                continue
+            reported.add(name)
+            findings.append({
+                "type": "embedded_archive",
+                "format": name,
+                "offset": offset,
+                "appended": end is not None and offset >= end,
+            })
+
+    if any(f["type"] == "embedded_archive" and f["format"] == "zip" for f in findings) and zipfile.is_zipfile(path):
+        result["action"] = "unpack"
+    elif result["findings"]:
+        result["action"] = "skip"
+    return result
+
+
+def _list_files(directory: Path, exclude: List[Path]) -> List[Path]:
+    excluded = {path.resolve() for path in exclude}
+    files = []
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file() or path.resolve() in excluded:
+            continue
+        if any(parent.resolve() in excluded for parent in path.parents):
+            continue
+        files.append(path)
+    return files
+
+
+def scan_directory(directory: Path, cache_path: Optional[Path] = None, max_workers: Optional[int] = None,
+                   exclude: List[Path] = ()) -> Dict:
+    """Scan every file under directory; files whose size and mtime match the cache are not read again"""
+    directory = Path(directory)
+    cache = {}
+    if cache_path and cache_path.exists():
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+
+    files = _list_files(directory, list(exclude) + ([cache_path] if cache_path else []))
+    results = {}
+    to_scan = []
+    for path in files:
+        key = path.relative_to(directory).as_posix()
+        stat = path.stat()
+        cached = cache.get(key)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            results[key] = cached
+        else:
+            to_scan.append((key, path))
+
+    if to_scan:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            scanned = executor.map(scan_file, [str(path) for _, path in to_scan], chunksize=8)
+            for (key, _), result in zip(to_scan, scanned):
+                results[key] = result
+
+    if cache_path:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, cache_path)
+
+    print(f"Scanned {len(to_scan)} files, {len(results) - len(to_scan)} unchanged since the last scan")
+    return {
+        "directory": str(directory),
+        "files": [{"path": key, **results[key]} for key in sorted(results)],
+    }
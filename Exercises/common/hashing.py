@@ -0,0 +1,13 @@
+"""Content hashes of files, read block by block so no file is ever held in memory whole."""
+from pathlib import Path
+import hashlib
+
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+def file_sha256(path: str | Path, block_bytes: int = HASH_BLOCK_BYTES) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_bytes), b""):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,257 @@
+"""One OpenAI client layer for every exercise: pooled connections, shared rate limits, retries.
+
+get_client() / get_async_client() return objects that are called exactly like
+OpenAI / AsyncOpenAI (client.chat.completions.create(...), client.audio...,
+client.embeddings..., client.images...). Every call first takes its share of two
+token buckets, requests per minute and tokens per minute, which are shared by all
+threads and by the sync and async clients of the process. 429s, 5xx and connection
+errors are retried with jittered exponential backoff, waiting as long as the
+server's Retry-After asks when it sends one.
+
+Limits come from OPENAI_REQUESTS_PER_MINUTE and OPENAI_TOKENS_PER_MINUTE.
+"""
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+import asyncio
+import inspect
+import json
+import os
+import random
+import threading
+import time
+
+import httpx
+from openai import (APIConnectionError, APIStatusError, AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient,
+                    OpenAI)
+from openai._resource import AsyncAPIResource, SyncAPIResource
+
+REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "200000"))
+
+MAX_CONNECTIONS = 32
+MAX_RETRIES = 5
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+RETRYABLE_STATUS = {408, 409, 429}
+
+# Rough token estimate before the real usage is known; corrected from response.usage
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 1000
+
+
+class TokenBucket:
+    """Refills at per_minute / 60 per second up to capacity; reservations may run it into debt.
+
+    Taking tokens never blocks; the caller is told how long to wait before its
+    reservation is covered, so sync and async callers can share one bucket.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount: float):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimits:
+    def __init__(self, requests_per_minute: float = REQUESTS_PER_MINUTE, tokens_per_minute: float = TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def reserve(self, tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def settle(self, estimated: int, response):
+        usage = getattr(response, "usage", None)
+        actual = getattr(usage, "total_tokens", None)
+        if isinstance(actual, int):
+            self.tokens.refund(estimated - actual)
+
+
+def estimate_tokens(kwargs: Dict) -> int:
+    """Prompt plus completion budget, with images counted flat instead of by their base64 size"""
+    def text_length(value) -> int:
+        if isinstance(value, str):
+            return len(value)
+        if isinstance(value, list):
+            return sum(text_length(item) for item in value)
+        if isinstance(value, dict):
+            if value.get("type") == "image_url":
+                return IMAGE_TOKENS * CHARS_PER_TOKEN
+            return sum(text_length(item) for item in value.values())
+        return 0
+
+    prompt = text_length(kwargs.get("messages", [])) + text_length(kwargs.get("input", ""))
+    prompt += text_length(kwargs.get("prompt", ""))
+    completion = kwargs.get("max_completion_tokens") or kwargs.get("max_tokens") or 0
+    return prompt // CHARS_PER_TOKEN + completion
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return isinstance(error, APIConnectionError)
+
+
+def backoff_delay(error: Exception, attempt: int) -> float:
+    requested = retry_after(error)
+    if requested is not None:
+        return min(requested, MAX_DELAY)
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+
+def _rewind_files(kwargs: Dict):
+    # An upload read by a failed attempt has to start from the beginning again
+    for value in kwargs.values():
+        for item in (value if isinstance(value, tuple) else (value,)):
+            if hasattr(item, "seek") and hasattr(item, "read"):
+                item.seek(0)
+
+
+def _describe(path: str, error: Exception, delay: float, attempt: int) -> str:
+    return f"Retrying {path} after {type(error).__name__} in {delay:.1f}s (attempt {attempt + 1}/{MAX_RETRIES})"
+
+
+class _Resource:
+    """Mirrors one level of the OpenAI client; calling a resource method goes through the client's call()
+
+    Only API resources (client.chat, client.chat.completions, ...) are wrapped. Anything
+    else, such as client.api_key, client.base_url or client.with_options, is returned as is.
+    """
+
+    def __init__(self, owner, target, path: str):
+        self._owner = owner
+        self._target = target
+        self._path = path
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        path = f"{self._path}.{name}" if self._path else name
+        if isinstance(attribute, (SyncAPIResource, AsyncAPIResource)):
+            return _Resource(self._owner, attribute, path)
+        if isinstance(self._target, (SyncAPIResource, AsyncAPIResource)) and inspect.ismethod(attribute):
+            return lambda *args, **kwargs: self._owner.call(path, attribute, *args, **kwargs)
+        return attribute
+
+
+class LLMClient(_Resource):
+    def __init__(self, limits: Optional["RateLimits"] = None, **openai_kwargs):
+        # The openai defaults (timeouts, redirects) with a pool sized for MAX_CONNECTIONS
+        http_client = DefaultHttpxClient(limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                                             max_keepalive_connections=MAX_CONNECTIONS))
+        # Retries happen here, so they are paced by the shared limits and show up in the log
+        openai_kwargs.setdefault("max_retries", 0)
+        super().__init__(self, OpenAI(http_client=http_client, **openai_kwargs), "")
+        self.limits = limits or default_limits()
+
+    def call(self, path, method, *args, **kwargs):
+        estimated = estimate_tokens(kwargs)
+        for attempt in range(MAX_RETRIES + 1):
+            time.sleep(self.limits.reserve(estimated))
+            try:
+                _rewind_files(kwargs)
+                response = method(*args, **kwargs)
+            except Exception as e:
+                self.limits.tokens.refund(estimated)
+                if not is_retryable(e) or attempt == MAX_RETRIES:
+                    raise
+                delay = backoff_delay(e, attempt)
+                print(_describe(path, e, delay, attempt))
+                time.sleep(delay)
+                continue
+            self.limits.settle(estimated, response)
+            return response
+
+
+class AsyncLLMClient(_Resource):
+    def __init__(self, limits: Optional["RateLimits"] = None, **openai_kwargs):
+        http_client = DefaultAsyncHttpxClient(limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                                                  max_keepalive_connections=MAX_CONNECTIONS))
+        openai_kwargs.setdefault("max_retries", 0)
+        super().__init__(self, AsyncOpenAI(http_client=http_client, **openai_kwargs), "")
+        self.limits = limits or default_limits()
+
+    async def call(self, path, method, *args, **kwargs):
+        estimated = estimate_tokens(kwargs)
+        for attempt in range(MAX_RETRIES + 1):
+            await asyncio.sleep(self.limits.reserve(estimated))
+            try:
+                _rewind_files(kwargs)
+                response = await method(*args, **kwargs)
+            except Exception as e:
+                self.limits.tokens.refund(estimated)
+                if not is_retryable(e) or attempt == MAX_RETRIES:
+                    raise
+                delay = backoff_delay(e, attempt)
+                print(_describe(path, e, delay, attempt))
+                await asyncio.sleep(delay)
+                continue
+            self.limits.settle(estimated, response)
+            return response
+
+
+_default_limits: Optional[RateLimits] = None
+_clients: Dict[tuple, _Resource] = {}
+_clients_lock = threading.Lock()
+
+
+def default_limits() -> RateLimits:
+    global _default_limits
+    with _clients_lock:
+        if _default_limits is None:
+            _default_limits = RateLimits()
+        return _default_limits
+
+
+def _shared(cls, openai_kwargs):
+    key = (cls, json.dumps(openai_kwargs, sort_keys=True, default=str))
+    limits = default_limits()
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = cls(limits=limits, **openai_kwargs)
+        return _clients[key]
+
+
+def get_client(**openai_kwargs) -> LLMClient:
+    """Process-wide sync client; openai_kwargs (api_key, base_url, ...) go to OpenAI()"""
+    return _shared(LLMClient, openai_kwargs)
+
+
+def get_async_client(**openai_kwargs) -> AsyncLLMClient:
+    """Process-wide async client sharing the sync client's rate limits"""
+    return _shared(AsyncLLMClient, openai_kwargs)
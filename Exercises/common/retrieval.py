@@ -0,0 +1,70 @@
+"""Small local BM25 retrieval used to trim prompt context to the passages a question needs."""
+from typing import Callable
+import re
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+def tokenize(text: str, stem_length: int = 6) -> list[str]:
+    # Truncating words is a crude stemmer, but it lets Polish inflections
+    # ("instytut", "instytutu", "instytucie") share a term
+    return [word[:stem_length] for word in _WORD_RE.findall(text.lower())]
+
+
+def sentence_windows(text: str, window: int = 3, stride: int = 3) -> list[str]:
+    """Runs of `window` sentences, `stride` sentences apart.
+
+    The default stride equals the window, so no sentence is in two windows and
+    pack_passages never spends the budget on the same sentence twice.
+    """
+    sentences = [s.strip() for s in _SENTENCE_RE.split(text) if s.strip()]
+    if len(sentences) <= window:
+        return [" ".join(sentences)] if sentences else []
+    starts = range(0, len(sentences) - window + stride, stride)
+    return [" ".join(sentences[start:start + window]) for start in starts]
+
+
+class BM25Index:
+    def __init__(self, passages: list[str], k1: float = 1.5, b: float = 0.75, stem_length: int = 6):
+        self.passages = passages
+        self.stem_length = stem_length
+        tokenized = [tokenize(p, stem_length) for p in passages]
+        self.vocabulary = {term: i for i, term in enumerate(sorted({t for doc in tokenized for t in doc}))}
+
+        counts = np.zeros((len(passages), len(self.vocabulary)), dtype=np.float32)
+        for row, doc in enumerate(tokenized):
+            for term in doc:
+                counts[row, self.vocabulary[term]] += 1
+
+        lengths = counts.sum(axis=1, keepdims=True)
+        average_length = lengths.mean() if len(passages) else 0.0
+        document_frequency = (counts > 0).sum(axis=0)
+        idf = np.log(1 + (len(passages) - document_frequency + 0.5) / (document_frequency + 0.5))
+        norm = k1 * (1 - b + b * lengths / max(average_length, 1e-9))
+        # Per (passage, term) BM25 weight, so scoring a query is a column sum
+        self.weights = idf * counts * (k1 + 1) / (counts + norm)
+
+    def scores(self, query: str) -> np.ndarray:
+        columns = [self.vocabulary[t] for t in set(tokenize(query, self.stem_length)) if t in self.vocabulary]
+        if not columns:
+            return np.zeros(len(self.passages), dtype=np.float32)
+        return self.weights[:, columns].sum(axis=1)
+
+
+def pack_passages(passages: list[str], scores: np.ndarray, token_budget: int,
+                  count_tokens: Callable[[str], int]) -> list[tuple[int, float]]:
+    """Greedily take the best scoring passages that fit the budget, returned in document order."""
+    selected = []
+    used = 0
+    for index in np.argsort(-scores, kind="stable"):
+        if scores[index] <= 0:
+            break
+        cost = count_tokens(passages[index])
+        if used + cost > token_budget:
+            continue
+        selected.append((int(index), float(scores[index])))
+        used += cost
+    return sorted(selected)
@@ -0,0 +1,185 @@
+"""Repeating-key XOR over NumPy arrays, with key recovery for unknown keys.
+
+xor_bytes / xor_file apply a key by broadcasting it over the input reshaped into
+key-length rows, so no per-byte Python loop or full-length keystream is involved;
+xor_file works block by block over a memory-mapped file.
+
+recover_key guesses the key length from the normalized Hamming distance between
+consecutive key-length blocks, then picks every key byte independently by scoring
+its column of ciphertext against English/Polish byte frequencies. The most likely
+key lengths are tried in parallel on a process pool.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, Tuple
+import mmap
+import os
+
+import numpy as np
+
+XOR_BLOCK_BYTES = 16 * 1024 * 1024
+# Key recovery only looks at the start of large inputs; the key length is estimated
+# on less, since the Hamming scan covers every length from min_length to max_length
+RECOVERY_SAMPLE_BYTES = 1024 * 1024
+HAMMING_SAMPLE_BYTES = 256 * 1024
+
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Letter frequencies in percent
+LETTER_FREQUENCIES = {
+    "en": {
+        "e": 12.7, "t": 9.1, "a": 8.2, "o": 7.5, "i": 7.0, "n": 6.7, "s": 6.3, "h": 6.1, "r": 6.0,
+        "d": 4.3, "l": 4.0, "c": 2.8, "u": 2.8, "m": 2.4, "w": 2.4, "f": 2.2, "g": 2.0, "y": 2.0,
+        "p": 1.9, "b": 1.5, "v": 1.0, "k": 0.8, "j": 0.15, "x": 0.15, "q": 0.1, "z": 0.07,
+    },
+    "pl": {
+        "a": 8.9, "i": 8.2, "o": 7.8, "e": 7.7, "z": 5.6, "n": 5.5, "r": 4.7, "w": 4.7, "s": 4.3,
+        "t": 4.0, "c": 4.0, "y": 3.8, "k": 3.5, "d": 3.3, "p": 3.1, "m": 2.8, "u": 2.5, "j": 2.3,
+        "l": 2.1, "b": 1.5, "g": 1.4, "h": 1.1, "f": 0.3, "v": 0.04, "x": 0.02, "q": 0.01,
+    },
+}
+
+
+def byte_log_weights(language: str = "en+pl") -> np.ndarray:
+    """Log-probability of every byte value in UTF-8 text of the given language(s)"""
+    languages = language.split("+")
+    probabilities = np.full(256, 1e-6)
+    for name in languages:
+        for letter, percent in LETTER_FREQUENCIES[name].items():
+            share = 0.6 * percent / 100 / len(languages)
+            probabilities[ord(letter)] += share
+            probabilities[ord(letter.upper())] += share * 0.05
+    probabilities[ord(" ")] += 0.15
+    probabilities[ord("\n")] += 0.01
+    for char in ".,;:!?'\"-()":
+        probabilities[ord(char)] += 0.002
+    probabilities[ord("0"):ord("9") + 1] += 0.001
+    probabilities[0x21:0x7F] += 0.0002
+    if "pl" in languages:
+        # Polish letters are two bytes in UTF-8: a 0xC3-0xC5 lead byte and a continuation byte
+        probabilities[0xC3:0xC6] += 0.006
+        probabilities[0x80:0xC0] += 0.0003
+    return np.log(probabilities / probabilities.sum())
+
+
+def _as_array(data) -> np.ndarray:
+    if isinstance(data, np.ndarray):
+        return data.view(np.uint8).ravel()
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def xor_array(data: np.ndarray, key: bytes, offset: int = 0) -> np.ndarray:
+    """XOR data with key repeated from position offset of the keystream"""
+    key_array = np.roll(np.frombuffer(key, dtype=np.uint8), -(offset % len(key)))
+    out = np.empty_like(data)
+    full = len(data) - len(data) % len(key)
+    np.bitwise_xor(data[:full].reshape(-1, len(key)), key_array, out=out[:full].reshape(-1, len(key)))
+    np.bitwise_xor(data[full:], key_array[:len(data) - full], out=out[full:])
+    return out
+
+
+def xor_bytes(data, key: bytes) -> bytes:
+    return xor_array(_as_array(data), key).tobytes()
+
+
+def xor_file(source: Path, target: Path, key: bytes, block_bytes: int = XOR_BLOCK_BYTES):
+    """XOR a file of any size into target, one block of the memory-mapped source at a time"""
+    block_bytes -= block_bytes % len(key)
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        if Path(source).stat().st_size == 0:
+            return
+        with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = np.frombuffer(mapped, dtype=np.uint8)
+            for start in range(0, len(data), block_bytes):
+                dst.write(xor_array(data[start:start + block_bytes], key))
+            del data
+
+
+def hamming_distance(sample: np.ndarray, length: int) -> float:
+    """Mean differing bits per byte between consecutive key-length blocks"""
+    rows = len(sample) // length
+    blocks = sample[:rows * length].reshape(rows, length)
+    differing_bits = POPCOUNT[blocks[:-1] ^ blocks[1:]].sum(dtype=np.int64)
+    return float(differing_bits / ((rows - 1) * length))
+
+
+def _xor_weight_matrix(weights: np.ndarray) -> np.ndarray:
+    # Row k scores a column for key byte k: matrix[k, c] = weight of plaintext byte c ^ k
+    values = np.arange(256, dtype=np.uint8)
+    return weights[values[:, None] ^ values[None, :]]
+
+
+def recover_key_for_length(sample: np.ndarray, length: int, language: str = "en+pl") -> Tuple[bytes, float]:
+    """Best key of the given length and the mean log-weight per byte of the text it decrypts to"""
+    matrix = _xor_weight_matrix(byte_log_weights(language))
+    rows = len(sample) // length
+    columns = sample[:rows * length].reshape(rows, length)
+    key = bytearray()
+    total = 0.0
+    for column in columns.T:
+        counts = np.bincount(column, minlength=256)
+        scores = matrix @ counts
+        best = int(np.argmax(scores))
+        key.append(best)
+        total += scores[best]
+    return bytes(key), float(total / max(rows * length, 1))
+
+
+# Set in each pool worker once, so the sample is not pickled for every task
+_worker_sample = None
+
+
+def _init_worker(sample: np.ndarray):
+    global _worker_sample
+    _worker_sample = sample
+
+
+def _hamming_task(length: int) -> Tuple[int, float]:
+    return length, hamming_distance(_worker_sample[:HAMMING_SAMPLE_BYTES], length)
+
+
+def _recover_task(args) -> Tuple[int, bytes, float]:
+    length, language = args
+    return (length, *recover_key_for_length(_worker_sample, length, language))
+
+
+def smallest_period(key: bytes) -> bytes:
+    """Shortest key that repeats to the given one, e.g. b"abcabc" -> b"abc\""""
+    for length in range(1, len(key) + 1):
+        if len(key) % length == 0 and key[:length] * (len(key) // length) == key:
+            return key[:length]
+    return key
+
+
+def recover_key(data, min_length: int = 1, max_length: int = 40, candidates: int = 6,
+                language: str = "en+pl", max_workers: Optional[int] = None,
+                sample_bytes: int = RECOVERY_SAMPLE_BYTES, tolerance: float = 0.1) -> Tuple[bytes, float]:
+    """Recover a repeating XOR key; returns the key and its mean log-weight per byte.
+
+    Every key length is scored by Hamming distance and the `candidates` best are
+    each solved in full, both on a process pool with one process per CPU unless
+    max_workers says otherwise (a single worker runs in-process). Longer keys always
+    fit the sample a little better, so the shortest key scoring within `tolerance`
+    of the best wins; it is then reduced to its shortest period.
+    """
+    # A copy, so no view into a caller's mmap outlives this call
+    sample = np.array(_as_array(data)[:sample_bytes])
+    lengths = range(min_length, min(max_length, len(sample[:HAMMING_SAMPLE_BYTES]) // 2) + 1)
+    if not lengths:
+        raise ValueError(f"Need at least {2 * min_length} bytes to recover a key")
+
+    workers = max_workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(sample)
+        distances = [_hamming_task(length) for length in lengths]
+        best_lengths = [length for length, _ in sorted(distances, key=lambda item: item[1])[:candidates]]
+        results = [_recover_task((length, language)) for length in best_lengths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(sample,)) as executor:
+            distances = list(executor.map(_hamming_task, lengths))
+            best_lengths = [length for length, _ in sorted(distances, key=lambda item: item[1])[:candidates]]
+            results = list(executor.map(_recover_task, [(length, language) for length in best_lengths]))
+
+    best = max(score for _, _, score in results)
+    _, key, score = min((result for result in results if result[2] >= best - tolerance), key=lambda result: result[0])
+    return smallest_period(key), score